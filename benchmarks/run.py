@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for bitty's CRUD hot paths.
+
+Times ``add``, ``add_many``, ``find`` (with each lookup type), ``get``,
+``update`` & ``delete`` against tables of several sizes, on a SQLite file & an
+in-memory SQLite database by default.
+
+Usage::
+
+    # Everything (1k to 1M rows), written as JSON.
+    python benchmarks/run.py --output results.json
+    
+    # Quicker, & flagging anything 20% slower than a previous run.
+    python benchmarks/run.py --sizes 1000,10000 --baseline baseline.json
+    
+    # Keep a run as the baseline for later.
+    python benchmarks/run.py --save-baseline baseline.json
+
+Exits with a non-zero status if any benchmark regressed against the baseline.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bitty
+
+
+BACKENDS = ('sqlite', 'sqlite-memory', 'memory')
+DEFAULT_BACKENDS = ('sqlite', 'sqlite-memory')
+DEFAULT_SIZES = (1000, 10000, 100000, 1000000)
+ADD_MANY_BATCH = 1000
+
+
+def connect(backend, path):
+    if backend == 'sqlite':
+        bit = bitty.Bitty('sqlite://%s' % path)
+    elif backend == 'sqlite-memory':
+        bit = bitty.Bitty('sqlite://:memory:')
+    else:
+        bit = bitty.Bitty('memory://')
+        bit.adapter.create_table('people', ['name', 'age'])
+        bit.adapter.create_index('people', 'name', kind='sorted')
+        bit.adapter.create_index('people', 'age', kind='hash')
+        return bit
+    
+    bit.raw("CREATE TABLE people (id INTEGER PRIMARY KEY AUTOINCREMENT, name VARCHAR(255), age INTEGER NULL);")
+    bit.raw("CREATE INDEX people_name ON people (name);")
+    bit.raw("CREATE INDEX people_age ON people (age);")
+    return bit
+
+
+def make_row(count):
+    return {'name': 'person-%07d' % count, 'age': count % 100}
+
+
+def summarize(durations, rows=None):
+    """
+    Turns a list of per-operation timings (in seconds) into the numbers that
+    get reported.
+    """
+    durations = sorted(durations)
+    total = sum(durations)
+    count = len(durations)
+    
+    def percentile(fraction):
+        return durations[min(count - 1, int(count * fraction))] * 1000
+    
+    summary = {
+        'ops': count,
+        'total_s': total,
+        'ops_per_s': count / total if total else 0.0,
+        'mean_ms': total / count * 1000,
+        'p50_ms': percentile(0.5),
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99),
+    }
+    
+    if rows is not None:
+        summary['rows_per_s'] = rows / total if total else 0.0
+    
+    return summary
+
+
+def timed(calls):
+    durations = []
+    
+    for call in calls:
+        start = time.perf_counter()
+        call()
+        durations.append(time.perf_counter() - start)
+    
+    return durations
+
+
+def find_lookups(size, rng):
+    # Each is selective enough to keep result sets small, whatever the size.
+    def pick():
+        return rng.randint(1, size)
+    
+    return {
+        'find_exact': lambda: {'name': 'person-%07d' % pick()},
+        'find_in': lambda: {'id__in': [pick() for count in range(10)]},
+        'find_lt': lambda: {'id__lt': 50},
+        'find_lte': lambda: {'id__lte': 50},
+        'find_gt': lambda: {'id__gt': size - 50},
+        'find_gte': lambda: {'id__gte': size - 50},
+        'find_startswith': lambda: {'name__startswith': 'person-%06d' % (pick() // 10)},
+        'find_endswith': lambda: {'name__endswith': '%07d' % pick()},
+        'find_contains': lambda: {'name__contains': '-%06d' % (pick() // 10)},
+    }
+
+
+def run_size(backend, size, ops, seed):
+    rng = random.Random(seed)
+    handle, path = tempfile.mkstemp(suffix='.db')
+    os.close(handle)
+    os.remove(path)
+    bit = connect(backend, path)
+    results = {}
+    
+    try:
+        start = time.perf_counter()
+        bit.add_many('people', (make_row(count) for count in range(size)), batch_size=ADD_MANY_BATCH)
+        results['load'] = summarize([time.perf_counter() - start], rows=size)
+        
+        for name, lookup in sorted(find_lookups(size, rng).items()):
+            results[name] = summarize(timed([lambda kwargs=lookup(): bit.find('people', **kwargs) for count in range(ops)]))
+        
+        results['get'] = summarize(timed([lambda pk=rng.randint(1, size): bit.get('people', id=pk) for count in range(ops)]))
+        results['update'] = summarize(timed([lambda pk=rng.randint(1, size), age=rng.randint(0, 99): bit.update('people', pk, age=age) for count in range(ops)]))
+        results['add'] = summarize(timed([lambda count=count: bit.add('people', **make_row(size + count)) for count in range(ops)]))
+        
+        batches = [[make_row(size + ops + batch * ADD_MANY_BATCH + count) for count in range(ADD_MANY_BATCH)] for batch in range(max(1, ops // 100))]
+        results['add_many'] = summarize(timed([lambda batch=batch: bit.add_many('people', batch, batch_size=ADD_MANY_BATCH) for batch in batches]), rows=len(batches) * ADD_MANY_BATCH)
+        
+        pks = rng.sample(range(1, size + 1), min(ops, size))
+        results['delete'] = summarize(timed([lambda pk=pk: bit.delete('people', pk) for pk in pks]))
+    finally:
+        bit.close()
+        
+        if os.path.exists(path):
+            os.remove(path)
+    
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Returns ``(key, baseline_ops_per_s, ops_per_s, change)`` for every
+    benchmark more than ``threshold`` (a fraction) slower than the baseline.
+    """
+    regressions = []
+    
+    for key, current in sorted(results.items()):
+        previous = baseline.get(key)
+        
+        if previous is None or not previous['ops_per_s']:
+            continue
+        
+        change = current['ops_per_s'] / previous['ops_per_s'] - 1
+        
+        if change < -threshold:
+            regressions.append((key, previous['ops_per_s'], current['ops_per_s'], change))
+    
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks bitty's CRUD operations.")
+    parser.add_argument('--backends', default=','.join(DEFAULT_BACKENDS), help="Comma-separated, from: %s." % ', '.join(BACKENDS))
+    parser.add_argument('--sizes', default=','.join([str(size) for size in DEFAULT_SIZES]), help="Comma-separated table sizes, in rows.")
+    parser.add_argument('--ops', type=int, default=200, help="Operations timed per benchmark.")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="Where to write the results, as JSON.")
+    parser.add_argument('--baseline', help="Results (as JSON) from an earlier run to compare against.")
+    parser.add_argument('--threshold', type=float, default=0.2, help="How much slower (as a fraction) counts as a regression.")
+    parser.add_argument('--save-baseline', help="Also write the results here, for use as a later baseline.")
+    options = parser.parse_args(argv)
+    
+    backends = options.backends.split(',')
+    
+    for backend in backends:
+        if not backend in BACKENDS:
+            parser.error("'%s' is not a known backend." % backend)
+    
+    report = {
+        'meta': {
+            'bitty': '.'.join(bitty.__version__),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'ops': options.ops,
+        },
+        'results': {},
+    }
+    
+    for backend in backends:
+        for size in [int(size) for size in options.sizes.split(',')]:
+            for name, summary in sorted(run_size(backend, size, options.ops, options.seed).items()):
+                key = '%s/%s/%s' % (backend, size, name)
+                report['results'][key] = summary
+                print("%-40s %12.1f ops/s %10.3f ms mean %10.3f ms p99" % (key, summary['ops_per_s'], summary['mean_ms'], summary['p99_ms']))
+    
+    for path in (options.output, options.save_baseline):
+        if path:
+            with open(path, 'w') as output:
+                json.dump(report, output, indent=2, sort_keys=True)
+    
+    if not options.baseline:
+        return 0
+    
+    with open(options.baseline) as baseline:
+        regressions = compare(report['results'], json.load(baseline)['results'], options.threshold)
+    
+    for key, before, after, change in regressions:
+        print("REGRESSION %-40s %12.1f -> %12.1f ops/s (%+.0f%%)" % (key, before, after, change * 100))
+    
+    if not regressions:
+        print("No regressions against %s." % options.baseline)
+    
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -19,18 +19,25 @@ bit.update('people', 1, name='Toast Driven')
 toast = bit.get('people', id=1)
 
 # Select.
-if len(bit.find('people', id=1)):
+if bit.exists('people', id=1):
     for result in bit.find('people', id=1):
-        print result['name']
+        print(result['name'])
 
 for result in bit.find('people', name__in=['Moriah', 'Sean']):
-    print result['name']
+    print(result['name'])
 
 for result in bit.find('people', age__lte=20):
-    print result['name']
+    print(result['name'])
 
 for result in bit.find('people', name__in=['Moriah', 'Sean'], age__lte=20):
-    print result['name']
+    print(result['name'])
+
+# Count & aggregate (in the database, without fetching the rows).
+print(bit.count('people', age__lte=20))
+print(bit.aggregate('people', avg='age', max='age')['age__avg'])
+
+for group in bit.aggregate('people', sum='age', group_by='age'):
+    print(group['age'], group['age__sum'])
 
 # Delete.
 bit.delete('people', 1)
@@ -14,11 +14,14 @@ setup(
     url='http://github.com/toastdriven/bitty',
     py_modules=['bitty'],
     license='BSD',
+    python_requires='>=3.7',
     classifiers=[
         'Intended Audience :: Developers',
         'License :: OSI Approved :: BSD License',
         'Operating System :: OS Independent',
         'Programming Language :: Python',
+        'Programming Language :: Python :: 3',
+        'Programming Language :: Python :: 3 :: Only',
         'Topic :: Utilities'
     ],
 )
\ No newline at end of file
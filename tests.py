@@ -1,8 +1,15 @@
 from bitty import *
+import array
+import asyncio
+import datetime
+import gc
+import math
 import MySQLdb
 import os
 import psycopg2
 import sqlite3
+import threading
+import time
 import unittest
 
 
@@ -29,6 +36,11 @@ class BaseSQLAdapterTestCase(unittest.TestCase):
         self.assertEqual(self.base._build_insert_query('people', name='Daniel'), ('INSERT INTO people (name) VALUES (%s)', ['Daniel']))
         self.assertEqual(self.base._build_insert_query('test', text='foo'), ('INSERT INTO test (text) VALUES (%s)', ['foo']))
     
+    def test_build_bulk_insert_query(self):
+        self.assertEqual(self.base._build_bulk_insert_query('people', [{'name': 'Daniel'}]), ('INSERT INTO people (name) VALUES (%s)', ['Daniel']))
+        self.assertEqual(self.base._build_bulk_insert_query('people', [{'name': 'Daniel', 'age': 27}, {'name': 'Foo', 'age': 7}]), ('INSERT INTO people (age, name) VALUES (%s, %s), (%s, %s)', [27, 'Daniel', 7, 'Foo']))
+        self.assertEqual(self.base._build_bulk_insert_query('test', [{'text': 'foo'}, {'text': 'bar'}, {'text': 'baz'}]), ('INSERT INTO test (text) VALUES (%s), (%s), (%s)', ['foo', 'bar', 'baz']))
+    
     def test_build_update_query(self):
         self.assertEqual(self.base._build_update_query('people', 1, name='Daniel'), ('UPDATE people SET name = %s WHERE id = %s', ['Daniel', 1]))
         self.assertEqual(self.base._build_update_query('people', 1, age=27), ('UPDATE people SET age = %s WHERE id = %s', [27, 1]))
@@ -36,6 +48,55 @@ class BaseSQLAdapterTestCase(unittest.TestCase):
         self.assertEqual(self.base._build_update_query('people', 10, name='Daniel'), ('UPDATE people SET name = %s WHERE id = %s', ['Daniel', 10]))
         self.assertEqual(self.base._build_update_query('test', 10, name='Daniel', age=27), ('UPDATE test SET age = %s, name = %s WHERE id = %s', [27, 'Daniel', 10]))
     
+    def test_build_update_where_query(self):
+        self.assertEqual(self.base._build_update_where_query('people', {'name': 'Daniel'}, id=1), ('UPDATE people SET name = %s WHERE id = %s', ['Daniel', 1]))
+        self.assertEqual(self.base._build_update_where_query('people', {'name': 'Daniel', 'age': 27}, age__lt=10, name__startswith='Dan'), ('UPDATE people SET age = %s, name = %s WHERE age < %s AND name LIKE %s', [27, 'Daniel', 10, 'Dan%']))
+        self.assertEqual(self.base._build_update_where_query('people', {'age': 1}, id__in=[1, 2, 3]), ('UPDATE people SET age = %s WHERE id IN (%s, %s, %s)', [1, 1, 2, 3]))
+    
+    def test_build_delete_where_query(self):
+        self.assertEqual(self.base._build_delete_where_query('people', id=1), ('DELETE FROM people WHERE id = %s', [1]))
+        self.assertEqual(self.base._build_delete_where_query('people', age__gte=10, name__contains='a'), ('DELETE FROM people WHERE age >= %s AND name LIKE %s', [10, '%a%']))
+        self.assertEqual(self.base._build_delete_where_query('people', id__in=[4, 5]), ('DELETE FROM people WHERE id IN (%s, %s)', [4, 5]))
+    
+    def test_build_upsert_query(self):
+        self.assertEqual(self.base._build_upsert_query('people', ['id'], id=1, name='Daniel'), ('INSERT INTO people (id, name) VALUES (%s, %s) ON CONFLICT (id) DO UPDATE SET name = excluded.name', [1, 'Daniel']))
+        self.assertEqual(self.base._build_upsert_query('people', ['name'], name='Daniel'), ('INSERT INTO people (name) VALUES (%s) ON CONFLICT (name) DO NOTHING', ['Daniel']))
+        self.assertEqual(self.base._build_bulk_upsert_query('people', ['id'], [{'id': 1, 'age': 27}, {'id': 2, 'age': 7}]), ('INSERT INTO people (age, id) VALUES (%s, %s), (%s, %s) ON CONFLICT (id) DO UPDATE SET age = excluded.age', [27, 1, 7, 2]))
+    
+    def test_build_aggregate_queries(self):
+        self.assertEqual(self.base._build_count_query('people'), ('SELECT COUNT(*) FROM people', []))
+        self.assertEqual(self.base._build_count_query('people', age__gte=10), ('SELECT COUNT(*) FROM people WHERE age >= %s', [10]))
+        self.assertEqual(self.base._build_exists_query('people', name='Daniel'), ('SELECT 1 FROM people WHERE name = %s LIMIT 1', ['Daniel']))
+        self.assertEqual(self.base._parse_aggregates('people', {'sum': 'age', 'max': ['age', 'id']}), (('max', 'age'), ('max', 'id'), ('sum', 'age')))
+        self.assertRaises(QueryError, self.base._parse_aggregates, 'people', {'sum': None})
+        self.assertRaises(QueryError, self.base._parse_aggregates, 'people', {'avg': 'text'})
+        self.assertEqual(self.base._build_aggregate_query('people', (('max', 'age'), ('sum', 'age')), (), id__lt=10), ('SELECT MAX(age), SUM(age) FROM people WHERE id < %s', [10]))
+        self.assertEqual(self.base._build_aggregate_query('people', (('avg', 'age'),), ('name',)), ('SELECT name, AVG(age) FROM people GROUP BY name ORDER BY name', []))
+    
+    def test_in_lookups(self):
+        self.assertEqual(self.base._split_in_lookup({'id__in': [1, 2, 3]}), [{'id__in': [1, 2, 3]}])
+        self.base.in_chunk_size = 2
+        self.assertEqual(self.base._split_in_lookup({'id__in': [1, 2, 3], 'age': 5}), [{'id__in': [1, 2], 'age': 5}, {'id__in': [3], 'age': 5}])
+        self.assertEqual(self.base._split_in_lookup({'id__in': [1, 2, 1, 2, 3], 'name__in': ['a', 'b']}), [{'id__in': [id], 'name__in': [name]} for id in (1, 2, 3) for name in ('a', 'b')])
+        self.assertEqual(self.base._split_in_lookup({'id__in': [1, 2, 3], 'name__in': ['a']}), [{'id__in': [1], 'name__in': ['a']}, {'id__in': [2], 'name__in': ['a']}, {'id__in': [3], 'name__in': ['a']}])
+        self.assertEqual(self.base._split_in_lookup({'id__in': [1, 1, 1], 'name__in': ['a']}), [{'id__in': [1], 'name__in': ['a']}])
+        self.assertEqual(self.base._split_in_lookup({'id__in': [1, 2]}), [{'id__in': [1, 2]}])
+        
+        # Bound as a single array, the statement doesn't change with the list.
+        self.base.IN_ARRAY = True
+        self.assertEqual(self.base._split_in_lookup({'id__in': [1, 2, 3]}), [{'id__in': [1, 2, 3]}])
+        self.assertEqual(self.base._build_select_query('people', id__in=[1, 2, 3]), ('SELECT age, id, name FROM people WHERE id = ANY(%s)', [[1, 2, 3]]))
+        self.assertEqual(self.base._build_select_query('people', id__in=[4]), ('SELECT age, id, name FROM people WHERE id = ANY(%s)', [[4]]))
+        self.assertEqual(self.base._build_delete_where_query('people', id__in=(5, 6)), ('DELETE FROM people WHERE id = ANY(%s)', [[5, 6]]))
+    
+    def test_build_search_query(self):
+        self.assertEqual(self.base._build_select_query('people', name__search='foo bar'), ("SELECT age, id, name FROM people WHERE to_tsvector('english', name) @@ plainto_tsquery('english', %s)", ['foo bar']))
+        self.assertEqual(self.base._build_select_query('people', name__search='foo bar', age__gt=10, order_by='name__search', limit=10), ("SELECT age, id, name FROM people WHERE age > %s AND to_tsvector('english', name) @@ plainto_tsquery('english', %s) ORDER BY ts_rank(to_tsvector('english', name), plainto_tsquery('english', %s)) DESC LIMIT %s", [10, 'foo bar', 'foo bar', 10]))
+        self.assertEqual(self.base._build_count_query('people', name__search='foo'), ("SELECT COUNT(*) FROM people WHERE to_tsvector('english', name) @@ plainto_tsquery('english', %s)", ['foo']))
+        self.assertRaises(QueryError, self.base._build_select_query, 'people', order_by='name__search')
+        self.assertRaises(QueryError, self.base._build_select_query, 'people', name__search='foo', order_by='name__search', after=1)
+        self.assertRaises(QueryError, self.base._build_where_clause, name__search='foo')
+    
     def test_build_delete_query(self):
         self.assertEqual(self.base._build_delete_query('people', 1), ('DELETE FROM people WHERE id = %s', [1]))
         self.assertEqual(self.base._build_delete_query('people', 2), ('DELETE FROM people WHERE id = %s', [2]))
@@ -48,6 +109,214 @@ class BaseSQLAdapterTestCase(unittest.TestCase):
         self.assertEqual(self.base._build_select_query('people', name='Daniel'), ('SELECT age, id, name FROM people WHERE name = %s', ['Daniel']))
         self.assertEqual(self.base._build_select_query('people', id=1, name='Daniel'), ('SELECT age, id, name FROM people WHERE id = %s AND name = %s', [1, 'Daniel']))
         self.assertEqual(self.base._build_select_query('test', text='Daniel'), ('SELECT id, text FROM test WHERE text = %s', ['Daniel']))
+        self.assertEqual(self.base._build_select_query('people', fields=['name', 'id'], age=27), ('SELECT name, id FROM people WHERE age = %s', [27]))
+        self.assertRaises(QueryError, self.base._build_select_query, 'people', fields=['text'])
+        
+        # Ordering & limits.
+        self.assertEqual(self.base._build_select_query('people', order_by='name'), ('SELECT age, id, name FROM people ORDER BY name', []))
+        self.assertEqual(self.base._build_select_query('people', order_by=['-age', 'id']), ('SELECT age, id, name FROM people ORDER BY age DESC, id', []))
+        self.assertEqual(self.base._build_select_query('people', limit=1), ('SELECT age, id, name FROM people LIMIT %s', [1]))
+        self.assertEqual(self.base._build_select_query('people', name='Daniel', limit=10, offset=20), ('SELECT age, id, name FROM people WHERE name = %s LIMIT %s OFFSET %s', ['Daniel', 10, 20]))
+        self.assertEqual(self.base._build_select_query('people', offset=20), ('SELECT age, id, name FROM people LIMIT ALL OFFSET %s', [20]))
+        self.assertRaises(QueryError, self.base._build_select_query, 'people', order_by='text')
+        
+        # Keyset pagination.
+        self.assertEqual(self.base._build_select_query('people', order_by='id', after=10, limit=5), ('SELECT age, id, name FROM people WHERE id > %s ORDER BY id LIMIT %s', [10, 5]))
+        self.assertEqual(self.base._build_select_query('people', name='Daniel', order_by='-id', after=10), ('SELECT age, id, name FROM people WHERE name = %s AND id < %s ORDER BY id DESC', ['Daniel', 10]))
+        self.assertEqual(self.base._build_select_query('people', order_by=['-age', 'id'], after=(27, 1)), ('SELECT age, id, name FROM people WHERE ((age < %s) OR (age = %s AND id > %s)) ORDER BY age DESC, id', [27, 27, 1]))
+        self.assertRaises(QueryError, self.base._build_select_query, 'people', after=10)
+        self.assertRaises(QueryError, self.base._build_select_query, 'people', order_by=['age', 'id'], after=10)
+    
+    def test_query_cache(self):
+        self.assertEqual(self.base.query_cache.info(), {'hits': 0, 'misses': 0, 'size': 0, 'max_size': 128})
+        self.assertEqual(self.base._build_select_query('people', id=1), ('SELECT age, id, name FROM people WHERE id = %s', [1]))
+        self.assertEqual(self.base._build_select_query('people', id=2), ('SELECT age, id, name FROM people WHERE id = %s', [2]))
+        self.assertEqual(self.base.query_cache.info(), {'hits': 1, 'misses': 1, 'size': 1, 'max_size': 128})
+        
+        # The arity of ``__in`` is part of the shape.
+        self.assertEqual(self.base._build_select_query('people', id__in=[1, 2]), ('SELECT age, id, name FROM people WHERE id IN (%s, %s)', [1, 2]))
+        self.assertEqual(self.base._build_select_query('people', id__in=[3, 4, 5]), ('SELECT age, id, name FROM people WHERE id IN (%s, %s, %s)', [3, 4, 5]))
+        self.assertEqual(self.base._build_select_query('people', id__in=[6, 7]), ('SELECT age, id, name FROM people WHERE id IN (%s, %s)', [6, 7]))
+        self.assertEqual(self.base._build_select_query('people', name__startswith='Dan', limit=5), ('SELECT age, id, name FROM people WHERE name LIKE %s LIMIT %s', ['Dan%', 5]))
+        self.assertEqual(self.base._build_select_query('people', name__startswith='Foo', limit=10), ('SELECT age, id, name FROM people WHERE name LIKE %s LIMIT %s', ['Foo%', 10]))
+        self.assertEqual(self.base.query_cache.info(), {'hits': 3, 'misses': 4, 'size': 4, 'max_size': 128})
+        
+        self.assertEqual(self.base._build_insert_query('people', name='Daniel'), ('INSERT INTO people (name) VALUES (%s)', ['Daniel']))
+        self.assertEqual(self.base._build_insert_query('people', name='Foo'), ('INSERT INTO people (name) VALUES (%s)', ['Foo']))
+        self.assertEqual(self.base._build_update_query('people', 1, name='Daniel'), ('UPDATE people SET name = %s WHERE id = %s', ['Daniel', 1]))
+        self.assertEqual(self.base._build_update_query('people', 2, name='Foo'), ('UPDATE people SET name = %s WHERE id = %s', ['Foo', 2]))
+        self.assertEqual(self.base._build_delete_query('people', 1), ('DELETE FROM people WHERE id = %s', [1]))
+        self.assertEqual(self.base._build_delete_query('people', 2), ('DELETE FROM people WHERE id = %s', [2]))
+        self.assertEqual(self.base.query_cache.info(), {'hits': 6, 'misses': 7, 'size': 7, 'max_size': 128})
+        
+        small = MockBaseSQLAdapter('foo:///bar', query_cache_size=2)
+        small._build_delete_query('people', 1)
+        small._build_delete_query('test', 1)
+        small._build_delete_query('other', 1)
+        self.assertEqual(small.query_cache.info(), {'hits': 0, 'misses': 3, 'size': 2, 'max_size': 2})
+        small._build_delete_query('people', 1)
+        self.assertEqual(small.query_cache.info(), {'hits': 0, 'misses': 4, 'size': 2, 'max_size': 2})
+        
+        uncached = MockBaseSQLAdapter('foo:///bar', query_cache_size=0)
+        self.assertEqual(uncached.query_cache, None)
+        self.assertEqual(uncached._build_select_query('people', id=1), ('SELECT age, id, name FROM people WHERE id = %s', [1]))
+    
+    def test_get_row_converter(self):
+        rows = [(27, 1, 'Daniel'), (7, 2, 'Foo')]
+        column_names = ['age', 'id', 'name']
+        self.assertEqual(self.base._get_row_converter('people', column_names)(rows), [{'age': 27, 'id': 1, 'name': 'Daniel'}, {'age': 7, 'id': 2, 'name': 'Foo'}])
+        self.assertEqual(self.base._get_row_converter('people', column_names, 'tuple')(rows), [(27, 1, 'Daniel'), (7, 2, 'Foo')])
+        
+        people = self.base._get_row_converter('people', column_names, 'namedtuple')(rows)
+        self.assertEqual(people[0].name, 'Daniel')
+        self.assertEqual(people[1]._asdict(), {'age': 7, 'id': 2, 'name': 'Foo'})
+        self.assertEqual(people, [(27, 1, 'Daniel'), (7, 2, 'Foo')])
+        
+        people = self.base._get_row_converter('people', column_names, 'record')(rows)
+        self.assertTrue(isinstance(people[0], Record))
+        self.assertEqual(people[0].name, 'Daniel')
+        self.assertEqual(people[0]['age'], 27)
+        self.assertEqual(people[1]._asdict(), {'age': 7, 'id': 2, 'name': 'Foo'})
+        self.assertEqual(repr(people[1]), "People(age=7, id=2, name='Foo')")
+        self.assertEqual(tuple(people[1]), (7, 2, 'Foo'))
+        self.assertRaises(AttributeError, setattr, people[0], 'nope', 1)
+        self.assertRaises(KeyError, lambda: people[0]['nope'])
+        
+        # Classes are generated once per table's columns.
+        self.assertTrue(type(people[0]) is type(self.base._get_row_converter('people', column_names, 'record')(rows)[0]))
+        self.assertEqual(people, self.base._get_row_converter('people', column_names, 'record')(rows))
+        self.assertNotEqual(people[0], self.base._get_row_converter('people', column_names, 'namedtuple')(rows)[0])
+        
+        self.assertRaises(QueryError, self.base._get_row_converter, 'people', column_names, 'nope')
+        self.assertRaises(QueryError, self.base._get_row_converter, 'people', ['class', 'id'], 'record')
+        self.assertRaises(QueryError, self.base._get_row_converter, 'people', ['first name', 'id'], 'namedtuple')
+    
+    def test_column_builder(self):
+        builder = ColumnBuilder()
+        self.assertEqual(builder.build(), array.array('q'))
+        builder.extend((1, 2))
+        builder.extend((3,))
+        self.assertEqual(builder.build(), array.array('q', [1, 2, 3]))
+        builder.extend((4.5,))
+        self.assertEqual(builder.build(), array.array('d', [1.0, 2.0, 3.0, 4.5]))
+        builder.extend((6,))
+        self.assertEqual(builder.build(), array.array('d', [1.0, 2.0, 3.0, 4.5, 6.0]))
+        # NULLs keep a numeric column typed, as NaN...
+        builder.extend((None,))
+        self.assertEqual(builder.build().typecode, 'd')
+        self.assertEqual(builder.build()[:5], array.array('d', [1.0, 2.0, 3.0, 4.5, 6.0]))
+        self.assert_(math.isnan(builder.build()[5]))
+        # ...until something that isn't a number turns up.
+        builder.extend(('a',))
+        self.assertEqual(builder.build(), [1.0, 2.0, 3.0, 4.5, 6.0, None, 'a'])
+        
+        builder = ColumnBuilder()
+        builder.extend((None, None))
+        self.assertEqual(builder.build(), [None, None])
+        builder.extend((None, 1))
+        self.assertEqual(builder.build().typecode, 'd')
+        self.assertEqual(len([value for value in builder.build() if math.isnan(value)]), 3)
+        
+        builder = ColumnBuilder()
+        builder.extend(('a', 'b'))
+        builder.extend((1,))
+        self.assertEqual(builder.build(), ['a', 'b', 1])
+        
+        builder = ColumnBuilder()
+        builder.extend((1, 2 ** 70))
+        self.assertEqual(builder.build(), [1, 2 ** 70])
+        
+        try:
+            import numpy
+        except ImportError:
+            return
+        
+        # The dtype fits the whole column, not just the first chunk.
+        builder = ColumnBuilder(numpy=numpy)
+        builder.extend((1, 2))
+        builder.extend((3.5,))
+        self.assertEqual(builder.build().dtype, numpy.float64)
+        self.assertEqual(builder.build().tolist(), [1.0, 2.0, 3.5])
+        
+        builder = ColumnBuilder(numpy=numpy)
+        builder.extend((1, None))
+        self.assertEqual(builder.build().dtype, numpy.float64)
+        self.assertEqual(numpy.isnan(builder.build()).tolist(), [False, True])
+        
+        builder = ColumnBuilder(numpy=numpy)
+        builder.extend((1, 2))
+        builder.extend(('a', None))
+        self.assertEqual(builder.build().tolist(), [1, 2, 'a', None])
+        self.assertEqual(ColumnBuilder(numpy=numpy).build().dtype, numpy.int64)
+    
+    def test_query_stats(self):
+        stats = QueryStats()
+        stats.after_execute('SELECT id FROM people WHERE id IN (%s, %s)', [1, 2], 0.0002)
+        stats.after_execute('SELECT id FROM people WHERE id IN (%s, %s, %s)', [1, 2, 3], 0.002, error=ValueError())
+        stats.after_fetch('SELECT id FROM people WHERE id IN (%s)', 3, 0.001, 0.0005)
+        stats.after_execute('INSERT INTO people (name) VALUES (%s), (%s)', ['a', 'b'], 10)
+        snapshot = stats.snapshot()
+        self.assertEqual(sorted(snapshot.keys()), ['INSERT INTO people (name) VALUES (...), ...', 'SELECT id FROM people WHERE id IN (...)'])
+        select = snapshot['SELECT id FROM people WHERE id IN (...)']
+        self.assertEqual((select['count'], select['errors'], select['rows']), (2, 1, 3))
+        self.assertAlmostEqual(select['mean_ms'], 1.1)
+        self.assertAlmostEqual(select['max_ms'], 2.0)
+        self.assertAlmostEqual(select['convert_ms'], 0.5)
+        self.assertEqual((select['histogram']['<=0.5ms'], select['histogram']['<=5ms'], select['histogram']['>5000ms']), (1, 1, 0))
+        self.assertEqual(snapshot['INSERT INTO people (name) VALUES (...), ...']['histogram']['>5000ms'], 1)
+        stats.reset()
+        self.assertEqual(stats.snapshot(), {})
+    
+    def test_slow_query_log(self):
+        log = SlowQueryLog(1)
+        
+        with self.assertLogs('bitty', level='WARNING') as logged:
+            log.after_execute('SELECT id FROM people WHERE name IN (%s, %s)', ['Daniel', 'Foo'], 0.002)
+            log.after_execute('SELECT id FROM people', [], 0.0005)
+        
+        # Just the shape, without the values.
+        self.assertEqual(logged.output, ['WARNING:bitty:Slow query (2.0ms): SELECT id FROM people WHERE name IN (...)'])
+        self.assertEqual(log.snapshot(), {'threshold_ms': 1, 'count': 1, 'recent': [{'query': 'SELECT id FROM people WHERE name IN (...)', 'duration_ms': 2.0}]})
+        
+        log = SlowQueryLog(1, log_params=True)
+        
+        with self.assertLogs('bitty', level='WARNING') as logged:
+            log.after_execute('SELECT id FROM people WHERE name IN (%s, %s)', ['Daniel', 'Foo'], 0.002)
+        
+        self.assertEqual(logged.output, ["WARNING:bitty:Slow query (2.0ms): SELECT id FROM people WHERE name IN (%s, %s) ['Daniel', 'Foo']"])
+        self.assertEqual(log.snapshot()['recent'], [{'query': 'SELECT id FROM people WHERE name IN (%s, %s)', 'params': ['Daniel', 'Foo'], 'duration_ms': 2.0}])
+    
+    def test_memory_cache(self):
+        cache = MemoryCache(max_entries=2)
+        self.assertEqual(cache.get('a'), None)
+        self.assertEqual(cache.set('a', [{'id': 1}], 'people'), True)
+        self.assertEqual(cache.set('b', [], 'people'), True)
+        self.assertEqual(cache.get('a'), [{'id': 1}])
+        self.assertEqual(cache.get('b'), [])
+        self.assertEqual(cache.set('c', [{'id': 1}], 'test'), True)
+        self.assertEqual(cache.get('a'), None)
+        self.assertEqual(len(cache), 2)
+        
+        cache.invalidate('people')
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('c'), [{'id': 1}])
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions'], stats['invalidations'], stats['size']), (3, 3, 1, 1, 1))
+        self.assert_(stats['bytes'] > 0)
+        
+        cache.set('d', [], 'test', ttl=0)
+        self.assertEqual(cache.get('d'), None)
+        self.assertEqual(cache.stats()['expirations'], 1)
+        cache.clear()
+        self.assertEqual((len(cache), cache.bytes), (0, 0))
+        
+        small = MemoryCache(max_bytes=600)
+        self.assertEqual(small.set('big', [{'text': 'x' * 1000}], 'test'), False)
+        self.assertEqual(small.set('a', [{'id': 1}], 'test'), True)
+        self.assertEqual(small.set('b', [{'id': 2}], 'test'), True)
+        self.assertEqual(small.set('c', [{'id': 3}], 'test'), True)
+        self.assert_(small.bytes <= 600)
+        self.assert_(small.stats()['evictions'] > 0)
     
     def test_get_column_names(self):
         self.assertEqual(self.base._get_column_names('people'), ['age', 'id', 'name'])
@@ -91,6 +360,27 @@ class SQLiteTestCase(unittest.TestCase):
         self.assertRaises(sqlite3.OperationalError, self.base.get_adapter, 'sqlite:///')
         self.assert_(isinstance(self.base.get_adapter("sqlite://%s" % self.db_name), SQLiteAdapter))
     
+    def test_dsn_options(self):
+        bit = Bitty("sqlite://%s?profile=throughput&cache_size=-2000&isolation_level=immediate" % self.db_name)
+        self.assertEqual(bit.raw("PRAGMA journal_mode").fetchone()[0], 'wal')
+        self.assertEqual(bit.raw("PRAGMA synchronous").fetchone()[0], 1)
+        self.assertEqual(bit.raw("PRAGMA cache_size").fetchone()[0], -2000)
+        self.assertEqual(bit.raw("PRAGMA busy_timeout").fetchone()[0], 5000)
+        self.assertEqual(bit.adapter.connection.isolation_level, 'IMMEDIATE')
+        self.assertEqual(len(bit.find('people')), 3)
+        bit.close()
+        
+        bit = Bitty("sqlite://%s?isolation_level=autocommit&check_same_thread=false&foreign_keys=on" % self.db_name)
+        self.assertEqual(bit.adapter.connection.isolation_level, None)
+        self.assertEqual(bit.raw("PRAGMA foreign_keys").fetchone()[0], 1)
+        bit.close()
+        
+        self.assertRaises(InvalidDSN, Bitty, "sqlite://%s?profile=nope" % self.db_name)
+        self.assertRaises(InvalidDSN, Bitty, "sqlite://%s?page_size=1" % self.db_name)
+        self.assertRaises(InvalidDSN, Bitty, "sqlite://%s?journal_mode=nope" % self.db_name)
+        self.assertRaises(InvalidDSN, Bitty, "sqlite://%s?mmap_size=lots" % self.db_name)
+        self.assertRaises(InvalidDSN, Bitty, "sqlite://%s?check_same_thread=maybe" % self.db_name)
+    
     def test_add(self):
         self.assertEqual(self.base.add('people', name='Daniel'), True)
         self.assertEqual(self.base.add('people', name='Daniel', age=27), True)
@@ -98,6 +388,335 @@ class SQLiteTestCase(unittest.TestCase):
         self.assertEqual(self.base.add('people', name='Daniel'), True)
         self.assertEqual(self.base.add('test', text='foo'), True)
     
+    def test_add_many(self):
+        self.assertEqual(self.base.add_many('people', []), 0)
+        self.assertEqual(self.base.add_many('people', [{'name': 'Bar', 'age': 1}, {'name': 'Baz'}, {'name': 'Qux', 'age': 3}], batch_size=2), 3)
+        self.assertEqual(self.base.find('people', id__gt=3), [{'age': 1, 'id': 4, 'name': u'Bar'}, {'age': 3, 'id': 5, 'name': u'Qux'}, {'age': None, 'id': 6, 'name': u'Baz'}])
+        self.assertEqual(self.base.add_many('test', ({'text': 'row %s' % i} for i in range(25)), batch_size=10), 25)
+        self.assertEqual(len(self.base.find('test')), 26)
+        self.assertRaises(QueryError, self.base.add_many, 'test', [{}])
+        self.assertRaises(QueryError, self.base.add_many, 'test', [{'text': 'foo'}], copy=True)
+        self.assertRaises(sqlite3.IntegrityError, self.base.add_many, 'people', [{'id': 1, 'name': 'Daniel'}])
+    
+    def test_buffered(self):
+        writer = self.base.buffered('test', max_rows=10, max_delay_ms=50)
+        
+        for i in range(25):
+            writer.add(text='row %s' % i)
+        
+        self.assertEqual(writer.flush(timeout=5), True)
+        self.assertEqual(self.base.count('test'), 26)
+        
+        # Only the bad rows are lost.
+        writer.add(text='good')
+        writer.add(id=1, text='duplicate')
+        writer.add(text='also good')
+        writer.flush()
+        self.assertEqual(self.base.count('test'), 28)
+        report = writer.report()
+        self.assertEqual((report['queued'], report['written'], report['failed'], report['pending']), (28, 27, 1, 0))
+        self.assertEqual(report['failures'][0][0], {'id': 1, 'text': 'duplicate'})
+        self.assert_(isinstance(report['failures'][0][1], sqlite3.IntegrityError))
+        
+        # As are rows with a column the table doesn't have, without holding
+        # up the rest of the batch.
+        writer.add(text='fine')
+        writer.add(txet='typo')
+        writer.add(text='also fine')
+        writer.flush()
+        self.assertEqual(self.base.count('test'), 30)
+        report = writer.report()
+        self.assertEqual((report['queued'], report['written'], report['failed'], report['retries']), (31, 29, 2, 0))
+        self.assertEqual(report['failures'][1][0], {'txet': 'typo'})
+        self.assert_(isinstance(report['failures'][1][1], QueryError))
+        
+        # Written once the delay is up, without a flush.
+        writer.add(text='later')
+        time.sleep(0.5)
+        self.assertEqual(self.base.count('test'), 31)
+        writer.close()
+        self.assertRaises(QueryError, writer.add, text='closed')
+        
+        # Closing the instance writes whatever's left.
+        bit = Bitty("sqlite://%s" % self.db_name)
+        writer = bit.buffered('test', max_delay_ms=60000)
+        writer.add(text='last')
+        bit.close()
+        self.assertEqual(self.base.count('test'), 32)
+        
+        # Backpressure, with the writer stopped.
+        writer = self.base.buffered('test', max_queued=1, timeout=0.01)
+        writer.queue.put(None)
+        writer._thread.join()
+        writer.add(text='waiting')
+        self.assertRaises(BufferFull, writer.add, text='full')
+        
+        # As is a flush that can't even be queued, with the writer stuck.
+        writer = self.base.buffered('test', max_queued=1, max_delay_ms=60000)
+        insert = writer._insert
+        unstuck = threading.Event()
+        
+        def stuck(rows):
+            unstuck.wait()
+            return insert(rows)
+        
+        writer._insert = stuck
+        writer.add(text='stuck')
+        self.assertEqual(writer.flush(timeout=0.01), False)
+        writer.add(text='queued')
+        self.assertEqual(writer.flush(timeout=0.01), False)
+        unstuck.set()
+        writer.close()
+        self.assertEqual(self.base.count('test'), 34)
+    
+    def test_buffered_retries(self):
+        writer = self.base.buffered('test', max_delay_ms=60000, retries=2, retry_delay_ms=1)
+        insert = writer._insert
+        errors = []
+        
+        def locked(rows):
+            if errors:
+                raise errors.pop()
+            
+            return insert(rows)
+        
+        writer._insert = locked
+        
+        # A lock keeps the whole batch & tries it again.
+        errors.extend([sqlite3.OperationalError('database is locked'), sqlite3.OperationalError('database is locked')])
+        writer.add(text='one')
+        writer.add(text='two')
+        writer.flush()
+        self.assertEqual(self.base.count('test'), 3)
+        report = writer.report()
+        self.assertEqual((report['written'], report['failed'], report['retries']), (2, 0, 2))
+        
+        # Past the retries, the rows are tried one at a time.
+        errors.extend([sqlite3.OperationalError('database is locked'), sqlite3.OperationalError('database is locked'), sqlite3.OperationalError('database is locked')])
+        writer.add(text='three')
+        writer.add(text='four')
+        writer.flush()
+        self.assertEqual(self.base.count('test'), 5)
+        report = writer.report()
+        self.assertEqual((report['written'], report['failed'], report['retries']), (4, 0, 4))
+        
+        # Once a row has used up its retries as well, the database is still
+        # out of reach, so the rest aren't tried.
+        errors.extend([sqlite3.OperationalError('database is locked')] * 6)
+        writer.add(text='five')
+        writer.add(text='six')
+        writer.flush()
+        self.assertEqual(self.base.count('test'), 5)
+        report = writer.report()
+        self.assertEqual((report['written'], report['failed'], report['retries']), (4, 2, 8))
+        self.assertEqual([row for row, error in report['failures']], [{'text': 'five'}, {'text': 'six'}])
+        self.assert_(isinstance(report['failures'][0][1], sqlite3.OperationalError))
+        
+        # Anything else is down to the query, so isn't retried.
+        errors.append(sqlite3.OperationalError('table test has no column named txet'))
+        writer.add(text='seven')
+        writer.add(text='eight')
+        writer.flush()
+        self.assertEqual(self.base.count('test'), 7)
+        report = writer.report()
+        self.assertEqual((report['written'], report['failed'], report['retries']), (6, 2, 8))
+        writer.close()
+        
+        # Rows added while closing are either written or refused, never left
+        # behind in the queue.
+        writer = self.base.buffered('test', max_rows=10, max_delay_ms=10)
+        refused = []
+        
+        def add_rows():
+            for i in range(200):
+                try:
+                    writer.add(text='racing')
+                except QueryError:
+                    refused.append(i)
+        
+        threads = [threading.Thread(target=add_rows) for i in range(4)]
+        
+        for thread in threads:
+            thread.start()
+        
+        time.sleep(0.01)
+        writer.close()
+        
+        for thread in threads:
+            thread.join()
+        
+        report = writer.report()
+        self.assertEqual(report['pending'], 0)
+        self.assertEqual(report['queued'] + len(refused), 800)
+        self.assertEqual(report['written'], report['queued'])
+    
+    def test_replicas(self):
+        # Stand-in replicas, each a copy of the table with one row telling
+        # them apart.
+        replicas = []
+        
+        for i in range(2):
+            path = '/tmp/bitty_test_replica_%s.db' % i
+            
+            if os.path.exists(path):
+                os.remove(path)
+            
+            replica = Bitty("sqlite://%s" % path)
+            replica.raw("""CREATE TABLE people (id INTEGER PRIMARY KEY AUTOINCREMENT, name VARCHAR(255), age INTEGER NULL);""")
+            replica.add('people', name='Replica %s' % i, age=i)
+            replica.close()
+            replicas.append("sqlite://%s" % path)
+        
+        self.assertRaises(BittyError, Bitty, "sqlite://%s" % self.db_name, replicas=replicas, replica_strategy='random')
+        
+        bit = Bitty("sqlite://%s" % self.db_name, replicas=replicas, replica_retry_after=60)
+        
+        # Reads take turns between the replicas.
+        self.assertEqual([bit.get('people')['name'] for i in range(4)], ['Replica 0', 'Replica 1', 'Replica 0', 'Replica 1'])
+        self.assertEqual(bit.count('people'), 1)
+        self.assertEqual(bit.exists('people', name='Replica 1'), True)
+        self.assertEqual(bit.aggregate('people', max='age'), {'age__max': 0})
+        self.assertEqual([row['name'] for row in bit.iter_find('people')], ['Replica 1'])
+        
+        # Writes go to the primary.
+        bit.add('people', name='Written', age=1)
+        self.assertEqual(self.base.count('people'), 4)
+        self.assertEqual(bit.count('people', name='Written'), 0)
+        
+        # Reads in a transaction see its writes.
+        with bit.transaction():
+            bit.update('people', 1, name='Changed')
+            self.assertEqual(bit.get('people', id=1)['name'], 'Changed')
+            self.assertEqual(bit.count('people'), 4)
+        
+        # A replica that stops responding is skipped.
+        bit.replicas.replicas[0].target.connection.close()
+        self.assertEqual([bit.get('people')['name'] for i in range(3)], ['Replica 1', 'Replica 1', 'Replica 1'])
+        stats = bit.stats()['replicas']
+        self.assertEqual([(replica['available'], replica['failures'], replica['outstanding']) for replica in stats], [(False, 1, 0), (True, 0, 0)])
+        
+        # With none left, the primary answers.
+        bit.replicas.replicas[1].down_until = time.time() + 60
+        self.assertEqual(bit.get('people', id=1)['name'], 'Changed')
+        
+        # Once the wait is up, the replica is reconnected & back in rotation.
+        bit.replicas.replicas[0].down_until = time.time()
+        self.assertEqual(bit.get('people')['name'], 'Replica 0')
+        self.assertEqual(bit.replica_stats()[0]['available'], True)
+        
+        # A bad query isn't the replica's fault.
+        self.assertRaises(QueryError, bit.find, 'nope')
+        self.assertEqual(bit.replica_stats()[0]['available'], True)
+        bit.close()
+        
+        bit = Bitty("sqlite://%s" % self.db_name, replicas=replicas, replica_strategy='least_outstanding', pool_size=2)
+        rows = bit.iter_find('people')
+        self.assertEqual(next(rows)['name'], 'Replica 0')
+        # The first replica is still busy with that read.
+        self.assertEqual(bit.get('people')['name'], 'Replica 1')
+        self.assertEqual([replica['outstanding'] for replica in bit.replica_stats()], [1, 0])
+        rows.close()
+        self.assertEqual([replica['outstanding'] for replica in bit.replica_stats()], [0, 0])
+        bit.close()
+        
+        # Cached results come from the primary, so a lagging replica's rows
+        # aren't kept after a write.
+        bit = Bitty("sqlite://%s" % self.db_name, replicas=replicas, cache=MemoryCache())
+        bit.update('people', 1, name='Cached')
+        self.assertEqual(bit.get('people', id=1)['name'], 'Cached')
+        self.assertEqual(bit.get('people', id=1)['name'], 'Cached')
+        # Uncached reads still go to the replicas.
+        self.assertEqual(bit.count('people'), 1)
+        bit.close()
+        
+        # ``iter_find`` moves on from a replica it can't connect to, as long
+        # as no rows have come back yet.
+        bit = Bitty("sqlite://%s" % self.db_name, replicas=['sqlite:///nonexistent/dir/replica.db', replicas[1]])
+        self.assertEqual([row['name'] for row in bit.iter_find('people')], ['Replica 1'])
+        self.assertEqual([(replica['available'], replica['outstanding']) for replica in bit.replica_stats()], [(False, 0), (True, 0)])
+        bit.close()
+        
+        # With none left, the primary answers.
+        bit = Bitty("sqlite://%s" % self.db_name, replicas=['sqlite:///nonexistent/dir/replica.db'])
+        self.assertEqual([row['id'] for row in bit.iter_find('people')], [1, 2, 3, 4])
+        bit.close()
+    
+    def test_sharded(self):
+        paths = ['/tmp/bitty_test_shard_%s.db' % i for i in range(3)]
+        
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+        
+        self.assertRaises(InvalidDSN, ShardedBitty, [], {'people': 'id'})
+        
+        bit = ShardedBitty(["sqlite://%s" % path for path in paths], {'people': 'id', 'posts': 'person_id'})
+        bit.raw("""CREATE TABLE people (id INTEGER PRIMARY KEY, name VARCHAR(255), age INTEGER NULL);""")
+        bit.raw("""CREATE TABLE posts (id INTEGER PRIMARY KEY AUTOINCREMENT, person_id INTEGER, title VARCHAR(255));""")
+        bit.raw("""CREATE TABLE test (id INTEGER PRIMARY KEY AUTOINCREMENT, text VARCHAR(255));""")
+        
+        self.assertEqual(bit.get_shard_index(1), bit.get_shard_index('1'))
+        self.assertEqual(bit.add_many('people', [{'id': i, 'name': 'Person %s' % i, 'age': i % 4} for i in range(1, 13)]), 12)
+        self.assertRaises(QueryError, bit.add, 'people', name='No key')
+        self.assertEqual(bit.add('posts', person_id=1, title='First'), True)
+        self.assertEqual(bit.add('test', text='moof'), True)
+        
+        # Each row is on exactly one shard, & they're spread around.
+        counts = [shard.count('people') for shard in bit.shards]
+        self.assertEqual(sum(counts), 12)
+        self.assert_(len([count for count in counts if count]) > 1)
+        self.assertEqual(bit.shard_for('people', 5).get('people', id=5)['name'], 'Person 5')
+        self.assertEqual(bit.shard_for('test').count('test'), 1)
+        self.assertEqual(bit.shard_for('posts', 1).count('posts'), 1)
+        
+        # Shard key lookups.
+        self.assertEqual(bit.get('people', id=5), {'id': 5, 'name': 'Person 5', 'age': 1})
+        self.assertEqual(bit.get('people', id=50), None)
+        self.assertEqual(bit.get('people', limit=5, order_by='id'), {'id': 1, 'name': 'Person 1', 'age': 1})
+        self.assertEqual([row['id'] for row in bit.find('people', id__in=[2, 7, 11, 50], order_by='id')], [2, 7, 11])
+        self.assertEqual(bit.find('people', id__in=[]), [])
+        
+        # Everything else is gathered from all the shards.
+        self.assertEqual(bit.count('people'), 12)
+        self.assertEqual(bit.count('people', age=0), 3)
+        self.assertEqual(bit.exists('people', name='Person 12'), True)
+        self.assertEqual(bit.exists('people', name='Nobody'), False)
+        self.assertEqual(len(bit.find('people')), 12)
+        self.assertEqual([row['id'] for row in bit.find('people', order_by='-id', limit=4)], [12, 11, 10, 9])
+        self.assertEqual([row['id'] for row in bit.find('people', order_by=['age', '-id'], limit=3, offset=2)], [4, 9, 5])
+        self.assertEqual(bit.find('people', fields=['name'], order_by=['-age', '-id'], limit=2, age__lt=3), [{'name': 'Person 10'}, {'name': 'Person 6'}])
+        self.assertEqual(bit.find('people', row_factory='tuple', fields=['id'], order_by='id', id__gt=10), [(11,), (12,)])
+        self.assertEqual(bit.get('people', order_by='-age', age__lt=3, name__contains='1'), {'id': 10, 'name': 'Person 10', 'age': 2})
+        
+        # Writes.
+        self.assertEqual(bit.update('people', 5, name='Five'), True)
+        self.assertEqual(bit.update('people', 50, name='Fifty'), False)
+        self.assertRaises(QueryError, bit.update, 'people', 5, id=6)
+        self.assertEqual(bit.get('people', id=5)['name'], 'Five')
+        
+        # Each shard numbers its own posts, so the same id turns up on more
+        # than one & a primary key alone can't say which row is meant.
+        other = [i for i in range(2, 20) if bit.get_shard_index(i) != bit.get_shard_index(1)][0]
+        self.assertEqual(bit.add('posts', person_id=other, title='Elsewhere'), True)
+        self.assertRaises(QueryError, bit.update, 'posts', 1, title='Edited')
+        self.assertRaises(QueryError, bit.delete, 'posts', 1)
+        self.assertRaises(QueryError, bit.delete_many, 'posts', [1])
+        self.assertEqual(bit.update_where('posts', {'title': 'Edited'}, person_id=1, id=1), 1)
+        self.assertEqual(bit.delete_where('posts', person_id=other, id=1), 1)
+        self.assertEqual([row['title'] for row in bit.find('posts')], ['Edited'])
+        
+        self.assertRaises(QueryError, bit.update_where, 'posts', {'person_id': 2}, title='Edited')
+        self.assertEqual(bit.update_where('people', {'age': 10}, age=0), 3)
+        self.assertEqual(bit.count('people', age=10), 3)
+        self.assertEqual(bit.upsert('people', ['id'], id=5, name='Five again', age=5), True)
+        self.assertEqual(bit.get('people', id=5)['name'], 'Five again')
+        self.assertEqual(bit.delete('people', 5), True)
+        self.assertEqual(bit.delete('people', 5), False)
+        self.assertEqual(bit.delete_many('people', [1, 2, 50]), 2)
+        self.assertEqual(bit.delete_where('people', age=10), 3)
+        self.assertEqual(bit.count('people'), 6)
+        bit.close()
+    
     def test_update(self):
         self.assertEqual(self.base.update('people', 1, name='Daniel'), True)
         self.assertEqual(self.base.update('people', 1, age=27), True)
@@ -112,6 +731,44 @@ class SQLiteTestCase(unittest.TestCase):
         # Wrong kind of pk.
         self.assertEqual(self.base.delete('test', '100'), False)
     
+    def test_update_where(self):
+        self.assertEqual(self.base.update_where('people', {'age': 30}, age__gte=20), 2)
+        self.assertEqual([row['age'] for row in self.base.find('people', order_by='id')], [30, 7, 30])
+        self.assertEqual(self.base.update_where('people', {'name': 'Nobody'}, name__startswith='Nope'), 0)
+        self.assertEqual(self.base.update_where('people', {'name': 'Both', 'age': 1}, id__in=[1, 2]), 2)
+        self.assertEqual(self.base.find('people', name='Both', order_by='id'), [{'age': 1, 'id': 1, 'name': u'Both'}, {'age': 1, 'id': 2, 'name': u'Both'}])
+        self.assertRaises(QueryError, self.base.update_where, 'people', {'age': 1})
+        self.assertRaises(QueryError, self.base.update_where, 'people', {}, id=1)
+    
+    def test_delete_where(self):
+        self.assertEqual(self.base.delete_where('people', age__lt=30), 2)
+        self.assertEqual(self.base.find('people'), [{'age': 35, 'id': 3, 'name': u'Moof'}])
+        self.assertEqual(self.base.delete_where('people', name='Nope'), 0)
+        self.assertRaises(QueryError, self.base.delete_where, 'people')
+        self.assertEqual(self.base.delete_many('people', []), 0)
+        self.assertEqual(self.base.delete_many('people', [3, 10]), 1)
+        self.assertEqual(self.base.find('people'), [])
+    
+    def test_upsert(self):
+        self.assertEqual(self.base.upsert('people', 'id', id=1, name='Daniel', age=28), True)
+        self.assertEqual(self.base.upsert('people', ['id'], id=4, name='Bar', age=1), True)
+        self.assertEqual(self.base.find('people', id__in=[1, 4], order_by='id'), [{'age': 28, 'id': 1, 'name': u'Daniel'}, {'age': 1, 'id': 4, 'name': u'Bar'}])
+        # Only the key leaves an existing row alone.
+        self.assertEqual(self.base.upsert('people', 'id', id=2), True)
+        self.assertEqual(self.base.find('people', id=2), [{'age': 7, 'id': 2, 'name': u'Foo'}])
+        self.assertRaises(QueryError, self.base.upsert, 'people', 'id')
+        self.assertRaises(QueryError, self.base.upsert, 'people', [], name='Daniel')
+        self.assertRaises(QueryError, self.base.upsert, 'people', 'id', name='Daniel')
+    
+    def test_upsert_many(self):
+        self.assertEqual(self.base.upsert_many('people', 'id', []), 0)
+        self.assertEqual(self.base.upsert_many('people', 'id', [{'id': 2, 'age': 8}, {'id': 5, 'name': 'Baz', 'age': 2}, {'id': 3, 'age': 36}, {'id': 2, 'age': 9}], batch_size=2), 4)
+        self.assertEqual(self.base.find('people', order_by='id'), [{'age': 27, 'id': 1, 'name': u'Daniel'}, {'age': 9, 'id': 2, 'name': u'Foo'}, {'age': 36, 'id': 3, 'name': u'Moof'}, {'age': 2, 'id': 5, 'name': u'Baz'}])
+        self.assertRaises(QueryError, self.base.upsert_many, 'people', 'id', [{'name': 'Nope'}])
+        # Counted as given, though only the last row per key is written.
+        self.assertEqual(self.base.upsert_many('people', 'id', [{'id': 1, 'age': 28}, {'id': 1, 'age': 29}]), 2)
+        self.assertEqual(self.base.get('people', id=1)['age'], 29)
+    
     def test_find(self):
         self.assertEqual(self.base.find('people'), [{'age': 27, 'id': 1, 'name': u'Daniel'}, {'age': 7, 'id': 2, 'name': u'Foo'}, {'age': 35, 'id': 3, 'name': u'Moof'}])
         self.assertEqual(self.base.find('people', id=1), [{'age': 27, 'id': 1, 'name': u'Daniel'}])
@@ -124,10 +781,444 @@ class SQLiteTestCase(unittest.TestCase):
         self.assertEqual(self.base.find('people', id__gte=1, name__startswith='Dan'), [{'age': 27, 'id': 1, 'name': u'Daniel'}])
         self.assertEqual(self.base.find('people', name__contains='a'), [{'age': 27, 'id': 1, 'name': u'Daniel'}])
     
+    def test_find_ordering(self):
+        self.assertEqual([row['id'] for row in self.base.find('people', order_by='age')], [2, 1, 3])
+        self.assertEqual([row['id'] for row in self.base.find('people', order_by='-age')], [3, 1, 2])
+        self.assertEqual([row['id'] for row in self.base.find('people', order_by='id', limit=2)], [1, 2])
+        self.assertEqual([row['id'] for row in self.base.find('people', order_by='id', limit=2, offset=2)], [3])
+        self.assertEqual([row['id'] for row in self.base.find('people', order_by='id', offset=1)], [2, 3])
+        self.assertEqual([row['id'] for row in self.base.find('people', order_by='-age', after=27)], [2])
+        self.assertEqual([row['id'] for row in self.base.find('people', id__lt=3, order_by=['age', 'id'], after=(7, 2))], [1])
+        self.assertRaises(QueryError, self.base.find, 'people', order_by='nope')
+    
+    def test_find_chunked_in(self):
+        bit = Bitty("sqlite://%s" % self.db_name, in_chunk_size=2)
+        bit.add_many('people', [{'name': 'Person %s' % i, 'age': i} for i in range(4, 10)])
+        ids = [9, 1, 2, 3, 4, 5, 2, 100]
+        self.assertEqual(sorted([row['id'] for row in bit.find('people', id__in=ids)]), [1, 2, 3, 4, 5, 9])
+        self.assertEqual([row['id'] for row in bit.find('people', id__in=ids, order_by='-age')], [3, 1, 9, 2, 5, 4])
+        self.assertEqual(bit.find('people', id__in=ids, order_by=['age'], fields=['name'], limit=2, offset=1), [{'name': u'Person 5'}, {'name': u'Foo'}])
+        self.assertEqual(bit.find('people', id__in=ids, age__lt=5, row_factory='tuple'), [(4, 4, u'Person 4')])
+        self.assertEqual(sorted([row['id'] for row in bit.iter_find('people', id__in=ids, chunk_size=1)]), [1, 2, 3, 4, 5, 9])
+        self.assertEqual([row['id'] for row in bit.iter_find('people', id__in=ids, order_by='id', limit=3)], [1, 2, 3])
+        self.assertEqual(bit.count('people', id__in=ids), 6)
+        self.assertEqual(bit.exists('people', id__in=[100, 101, 102, 9]), True)
+        self.assertEqual(sorted(bit.find_columns('people', columns=['id'], chunk_size=1, id__in=ids)['id']), [1, 2, 3, 4, 5, 9])
+        self.assertEqual(list(bit.find_columns('people', columns=['id'], id__in=ids, order_by='-age', limit=3)['id']), [3, 1, 9])
+        self.assertRaises(QueryError, bit.find_columns, 'people', fields=['id'])
+        
+        class Recorder(QueryHook):
+            def __init__(self):
+                self.queries = []
+            
+            def before_execute(self, query, params):
+                self.queries.append(query)
+        
+        # Stops at the first chunk with a match.
+        recorder = Recorder()
+        bit.add_hook(recorder)
+        self.assertEqual(bit.exists('people', id__in=[9, 1, 100, 101, 102, 103]), True)
+        bit.remove_hook(recorder)
+        self.assertEqual(len(recorder.queries), 1)
+        self.assertEqual(bit.update_where('people', {'age': 0}, id__in=ids), 6)
+        self.assertEqual(bit.delete_many('people', ids), 6)
+        self.assertEqual(bit.count('people'), 3)
+        bit.close()
+        
+        # The placeholders add up across every '__in' list, not just the
+        # longest one.
+        bit = Bitty("sqlite://%s" % self.db_name)
+        ids = list(range(1, 601))
+        names = [u'Person 6', u'Person 8'] + ['Nobody %s' % i for i in range(598)]
+        lookups = bit.adapter._split_in_lookup({'id__in': ids, 'name__in': names})
+        self.assertEqual(max([len(chunk['id__in']) + len(chunk['name__in']) for chunk in lookups]), 500)
+        self.assertEqual(sorted([row['id'] for row in bit.find('people', id__in=ids, name__in=names)]), [6, 8])
+        self.assertEqual(bit.count('people', id__in=ids, name__in=names), 2)
+        self.assertRaises(QueryError, bit.aggregate, 'people', sum='age', id__in=ids, name__in=names)
+        self.assertEqual(bit.aggregate('people', sum='age', id__in=ids[:10], name__in=names[:10]), {'age__sum': 14})
+        bit.close()
+    
+    def test_find_fields(self):
+        self.assertEqual(self.base.find('people', fields=['id', 'name'], age__gte=20, order_by='id'), [{'id': 1, 'name': u'Daniel'}, {'id': 3, 'name': u'Moof'}])
+        self.assertEqual(self.base.find('people', fields=['name'], id=2, row_factory='tuple'), [(u'Foo',)])
+        self.assertEqual(self.base.get('people', fields=['age'], name='Moof'), {'age': 35})
+        self.assertEqual(list(self.base.iter_find('people', fields=['name', 'id'], chunk_size=2)), [{'id': 1, 'name': u'Daniel'}, {'id': 2, 'name': u'Foo'}, {'id': 3, 'name': u'Moof'}])
+        row = self.base.get('people', fields=['name'], id=1, row_factory='namedtuple')
+        self.assertEqual(row.name, u'Daniel')
+        self.assertRaises(AttributeError, getattr, row, 'age')
+        self.assertRaises(QueryError, self.base.find, 'people', fields=['text'])
+    
+    def test_search(self):
+        self.base.create_search_index('people', 'name')
+        self.base.add_many('people', [{'name': 'Toast Driven'}, {'name': 'Driven Daniel Driven'}])
+        self.assertEqual([row['id'] for row in self.base.find('people', name__search='driven', order_by='id')], [4, 5])
+        self.assertEqual([row['id'] for row in self.base.find('people', name__search='daniel driven')], [5])
+        self.assertEqual([row['id'] for row in self.base.find('people', name__search='Daniel', order_by='id')], [1, 5])
+        # Most relevant first.
+        self.assertEqual([row['id'] for row in self.base.find('people', name__search='driven', order_by='name__search')], [5, 4])
+        self.assertEqual(self.base.count('people', name__search='driven'), 2)
+        # No words to look for, so nothing matches.
+        self.assertEqual(self.base.find('people', name__search=''), [])
+        self.assertEqual(self.base.find('people', name__search='   ', order_by='name__search'), [])
+        self.assertEqual(self.base.count('people', name__search='!!'), 0)
+        self.base.update('people', 4, name='Burnt')
+        self.base.delete('people', 5)
+        self.assertEqual(self.base.find('people', name__search='driven'), [])
+        self.assertEqual(self.base.find('people', name__search='burnt'), [{'age': None, 'id': 4, 'name': u'Burnt'}])
+        self.assertRaises(QueryError, self.base.find, 'people', order_by='name__search')
+    
+    def test_iter_find(self):
+        results = self.base.iter_find('people')
+        self.assertEqual(next(results), {'age': 27, 'id': 1, 'name': u'Daniel'})
+        self.assertEqual(list(results), [{'age': 7, 'id': 2, 'name': u'Foo'}, {'age': 35, 'id': 3, 'name': u'Moof'}])
+        self.assertEqual(list(self.base.iter_find('people', chunk_size=2)), self.base.find('people'))
+        self.assertEqual(list(self.base.iter_find('people', chunk_size=1, id__gte=2)), [{'age': 7, 'id': 2, 'name': u'Foo'}, {'age': 35, 'id': 3, 'name': u'Moof'}])
+        self.assertEqual(list(self.base.iter_find('test', text='Daniel')), [])
+    
+    def test_count(self):
+        self.assertEqual(self.base.count('people'), 3)
+        self.assertEqual(self.base.count('people', age__gte=20), 2)
+        self.assertEqual(self.base.count('people', name='Nope'), 0)
+        self.assertEqual(self.base.exists('people', name='Foo'), True)
+        self.assertEqual(self.base.exists('people', name__in=['Nope', 'Nada']), False)
+    
+    def test_aggregate(self):
+        self.assertEqual(self.base.aggregate('people', sum='age', min='age', max=['age', 'name']), {'age__max': 35, 'age__min': 7, 'age__sum': 69, 'name__max': u'Moof'})
+        self.assertEqual(self.base.aggregate('people', avg='age'), {'age__avg': 23})
+        self.assertEqual(self.base.aggregate('people', max='age', name='Nope'), {'age__max': None})
+        self.base.add('people', name='Foo', age=9)
+        self.assertEqual(self.base.aggregate('people', sum='age', max='id', group_by='name', age__lt=30), [{'age__sum': 27, 'id__max': 1, 'name': u'Daniel'}, {'age__sum': 16, 'id__max': 4, 'name': u'Foo'}])
+        self.assertRaises(QueryError, self.base.aggregate, 'people', group_by='name')
+        self.assertRaises(QueryError, self.base.aggregate, 'people', sum='nope')
+    
     def test_get(self):
         self.assertEqual(self.base.get('people', name='Daniel'), {'age': 27, 'id': 1, 'name': u'Daniel'})
         self.assertEqual(self.base.get('people', id=1, name='Daniel'), {'age': 27, 'id': 1, 'name': u'Daniel'})
         self.assertEqual(self.base.get('people', id=1, name='Daniel', age=27), {'age': 27, 'id': 1, 'name': u'Daniel'})
+        self.assertEqual(self.base.get('people', limit=10, order_by='-age'), {'age': 35, 'id': 3, 'name': u'Moof'})
+        self.assertEqual(self.base.get('people', limit=10, offset=1, order_by='-age'), {'age': 27, 'id': 1, 'name': u'Daniel'})
+    
+    def test_find_columns(self):
+        columns = self.base.find_columns('people', order_by='id')
+        self.assertEqual(sorted(columns.keys()), ['age', 'id', 'name'])
+        self.assertEqual(list(columns['age']), [27, 7, 35])
+        self.assertEqual(list(columns['id']), [1, 2, 3])
+        self.assertEqual(list(columns['name']), [u'Daniel', u'Foo', u'Moof'])
+        
+        columns = self.base.find_columns('people', columns=['age'], chunk_size=2, age__gt=10)
+        self.assertEqual(list(columns.keys()), ['age'])
+        self.assertEqual(sum(columns['age']), 62)
+        
+        self.assertEqual(list(self.base.find_columns('test', columns=['id'], text='nope')['id']), [])
+        
+        # A nullable numeric column stays numeric.
+        self.base.add('people', name='Ageless')
+        ages = self.base.find_columns('people', columns=['age'], chunk_size=2, order_by='id')['age']
+        self.assertEqual(len(ages), 4)
+        self.assertEqual(list(ages[:3]), [27, 7, 35])
+        self.assert_(math.isnan(ages[3]))
+        self.assertRaises(QueryError, self.base.find_columns, 'people', columns=['text'])
+        self.assertEqual(self.base.find('people', fields=['name'], age__gt=10, order_by='id'), [{'name': u'Daniel'}, {'name': u'Moof'}])
+        
+        try:
+            import numpy
+            self.assertTrue(isinstance(columns['age'], numpy.ndarray))
+        except ImportError:
+            self.assertEqual(columns['age'], array.array('q', [27, 35]))
+    
+    def test_row_factory(self):
+        self.assertEqual(self.base.find('people', id__lt=3, row_factory='tuple'), [(27, 1, u'Daniel'), (7, 2, u'Foo')])
+        self.assertEqual(self.base.get('people', id=1, row_factory='namedtuple').name, u'Daniel')
+        self.assertEqual([row.id for row in self.base.iter_find('people', chunk_size=2, row_factory='record')], [1, 2, 3])
+        
+        records = Bitty("sqlite://%s" % self.db_name, row_factory='record')
+        daniel = records.get('people', id=1)
+        self.assertEqual((daniel.age, daniel.id, daniel.name), (27, 1, u'Daniel'))
+        self.assertEqual(records.find('test', row_factory='dict'), [{'id': 1, 'text': u'moof'}])
+        self.assertRaises(QueryError, records.find, 'test', row_factory='nope')
+        records.close()
+    
+    def test_pool(self):
+        pooled = Bitty("sqlite://%s" % self.db_name, pool_size=2, pool_timeout=0.1)
+        self.assertEqual(pooled.adapter, None)
+        self.assertEqual(pooled.get('people', id=1), {'age': 27, 'id': 1, 'name': u'Daniel'})
+        self.assertEqual(pooled.pool_stats(), {'size': 2, 'max_overflow': 0, 'open': 1, 'idle': 1, 'in_use': 0, 'created': 1, 'checkouts': 1, 'timeouts': 0, 'discarded': 0, 'forks': 0})
+        
+        results = []
+        
+        def worker():
+            results.append(pooled.get('people', id=2))
+            pooled.add('test', text='thread')
+        
+        threads = [threading.Thread(target=worker) for i in range(8)]
+        
+        for thread in threads:
+            thread.start()
+        
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(results, [{'age': 7, 'id': 2, 'name': u'Foo'}] * 8)
+        self.assertEqual(len(self.base.find('test')), 9)
+        self.assertTrue(pooled.pool_stats()['open'] <= 2)
+        self.assertEqual(pooled.pool_stats()['in_use'], 0)
+        
+        # Everything is checked out.
+        first = pooled.pool.checkout()
+        second = pooled.pool.checkout()
+        self.assertRaises(PoolTimeout, pooled.get, 'people', id=1)
+        pooled.pool.checkin(first)
+        pooled.pool.checkin(second)
+        self.assertEqual(pooled.pool_stats()['timeouts'], 1)
+        
+        # A transaction holds onto a single connection.
+        with pooled.transaction():
+            pooled.add('people', name='Pooled')
+            self.assertEqual(pooled.get('people', name='Pooled'), {'age': None, 'id': 4, 'name': u'Pooled'})
+            self.assertEqual(pooled.pool_stats()['in_use'], 1)
+        
+        self.assertEqual(self.base.get('people', name='Pooled'), {'age': None, 'id': 4, 'name': u'Pooled'})
+        
+        # Broken connections aren't put back.
+        adapter = pooled.pool.checkout()
+        adapter.connection.close()
+        pooled.pool.checkin(adapter)
+        self.assertEqual(pooled.pool_stats()['discarded'], 1)
+        self.assertEqual(pooled.pool_stats()['open'], 1)
+        
+        # Nor is one that's died while sitting idle for long enough.
+        pooled.pool._idle[-1][0].connection.close()
+        pooled.pool.ping_after = 0
+        self.assertEqual(pooled.get('people', id=1), {'age': 27, 'id': 1, 'name': u'Daniel'})
+        self.assertEqual(pooled.pool_stats()['discarded'], 2)
+        self.assertEqual(pooled.pool_stats()['open'], 1)
+        
+        # Pretend the process forked.
+        pooled.pool.pid = -1
+        self.assertEqual(pooled.get('people', id=1), {'age': 27, 'id': 1, 'name': u'Daniel'})
+        self.assertEqual(pooled.pool_stats()['forks'], 1)
+        self.assertEqual(pooled.pool_stats()['open'], 1)
+        
+        pooled.close()
+        self.assertRaises(BittyError, pooled.get, 'people', id=1)
+    
+    def test_pool_health_checks(self):
+        # Checkouts & checkins don't add queries of their own, so they stay
+        # out of the stats.
+        pooled = Bitty("sqlite://%s" % self.db_name, pool_size=1, collect_stats=True, pool_ping_after=None)
+        
+        for i in range(3):
+            pooled.get('people', id=1)
+        
+        queries = pooled.stats()['queries']
+        self.assertEqual(sorted(queries.keys()), ['PRAGMA table_info(people)', 'SELECT age, id, name FROM people WHERE id = ? LIMIT ?'])
+        self.assertEqual(queries['SELECT age, id, name FROM people WHERE id = ? LIMIT ?']['count'], 3)
+        
+        # A failure has the connection checked before it's reused.
+        adapter = pooled.pool.checkout()
+        pings = []
+        ping = adapter.ping
+        adapter.ping = lambda: pings.append(True) or ping()
+        pooled.pool.checkin(adapter)
+        self.assertEqual(pings, [])
+        self.assertRaises(sqlite3.OperationalError, pooled.raw, "SELECT nope FROM people")
+        self.assertEqual(pings, [True])
+        self.assertEqual(pooled.pool_stats()['discarded'], 0)
+        pooled.close()
+    
+    def test_pool_overflow(self):
+        pooled = Bitty("sqlite://%s" % self.db_name, pool_size=1, max_overflow=1, pool_timeout=0)
+        first = pooled.pool.checkout()
+        second = pooled.pool.checkout()
+        self.assertRaises(PoolTimeout, pooled.pool.checkout)
+        self.assertEqual(pooled.pool_stats()['open'], 2)
+        pooled.pool.checkin(first)
+        pooled.pool.checkin(second)
+        self.assertEqual(pooled.pool_stats()['open'], 1)
+        self.assertEqual(pooled.pool_stats()['idle'], 1)
+        pooled.close()
+    
+    def test_async(self):
+        async def run():
+            bit = AsyncBitty("sqlite://%s" % self.db_name, max_workers=2)
+            self.assertEqual(await bit.add('people', name='Async', age=1), True)
+            self.assertEqual(await bit.get('people', name='Async'), {'age': 1, 'id': 4, 'name': u'Async'})
+            self.assertEqual(await bit.update('people', 4, age=2), True)
+            self.assertEqual(await bit.delete('people', 4), True)
+            self.assertEqual(await bit.add_many('test', [{'text': 'foo'}, {'text': 'bar'}]), 2)
+            
+            # Many concurrent queries share the two connections.
+            results = await asyncio.gather(*[bit.find('people', id=1) for i in range(10)])
+            self.assertEqual(results, [[{'age': 27, 'id': 1, 'name': u'Daniel'}]] * 10)
+            self.assertTrue(bit.bitty.pool_stats()['open'] <= 2)
+            
+            rows = []
+            
+            async for row in bit.iter_find('people', chunk_size=2, order_by='id'):
+                rows.append(row['id'])
+            
+            self.assertEqual(rows, [1, 2, 3])
+            
+            rows = bit.iter_find('test', chunk_size=1)
+            self.assertEqual(await rows.__anext__(), {'id': 1, 'text': u'moof'})
+            await rows.aclose()
+            self.assertEqual(bit.bitty.pool_stats()['in_use'], 0)
+            
+            self.assertEqual((await bit.raw("UPDATE test SET text = 'baz' WHERE id = 1;")).rowcount, 1)
+            await bit.close()
+            
+            # Open iterators, each holding a connection, don't starve the
+            # other calls.
+            bit = AsyncBitty("sqlite://%s" % self.db_name, max_workers=2, pool_timeout=1)
+            iterators = [bit.iter_find('people', chunk_size=1, order_by='id') for i in range(2)]
+            
+            for rows in iterators:
+                self.assertEqual((await rows.__anext__())['id'], 1)
+            
+            self.assertEqual(bit.bitty.pool_stats()['in_use'], 2)
+            self.assertEqual(await bit.get('people', id=2), {'age': 7, 'id': 2, 'name': u'Foo'})
+            
+            # One more waits its turn, until an earlier one is done.
+            rows = bit.iter_find('people', chunk_size=1, order_by='id')
+            waiting = asyncio.ensure_future(rows.__anext__())
+            await asyncio.sleep(0.05)
+            self.assertEqual(waiting.done(), False)
+            await iterators[0].aclose()
+            self.assertEqual((await waiting)['id'], 1)
+            
+            # An iterator that's never closed hands its connection back once
+            # it's gone, closing on the executor rather than the event loop.
+            del iterators
+            gc.collect()
+            self.assertEqual(bit.bitty.pool_stats()['in_use'], 2)
+            await asyncio.sleep(0.1)
+            self.assertEqual(bit.bitty.pool_stats()['in_use'], 1)
+            await rows.aclose()
+            self.assertEqual(bit.bitty.pool_stats()['in_use'], 0)
+            await bit.close()
+        
+        asyncio.run(run())
+    
+    def test_schema(self):
+        self.assertEqual(self.base.schema.tables(), [])
+        self.assertEqual(self.base.preload_schema(), ['people', 'test'])
+        self.assertEqual(self.base.schema.get('people'), ['age', 'id', 'name'])
+        self.assertEqual(self.base.schema.get('test'), ['id', 'text'])
+        self.assertRaises(QueryError, self.base.find, 'nope')
+        
+        self.assertEqual(self.base.get('people', id=1), {'age': 27, 'id': 1, 'name': u'Daniel'})
+        self.base.raw("ALTER TABLE people ADD COLUMN says VARCHAR(255) NULL;")
+        self.assertEqual(self.base.get('people', id=1), {'age': 27, 'id': 1, 'name': u'Daniel'})
+        self.assertEqual(self.base.refresh_schema('people'), ['age', 'id', 'name', 'says'])
+        self.assertEqual(self.base.get('people', id=1), {'age': 27, 'id': 1, 'name': u'Daniel', 'says': None})
+        
+        self.base.refresh_schema()
+        self.assertEqual(self.base.schema.tables(), [])
+        
+        expiring = Bitty("sqlite://%s" % self.db_name, schema_ttl=0)
+        self.assertEqual(expiring.get('test', id=1), {'id': 1, 'text': u'moof'})
+        self.assertEqual(expiring.schema.get('test'), None)
+        expiring.close()
+    
+    def test_query_cache_info(self):
+        self.assertEqual(self.base.get('people', id=1), {'age': 27, 'id': 1, 'name': u'Daniel'})
+        self.assertEqual(self.base.get('people', id=2), {'age': 7, 'id': 2, 'name': u'Foo'})
+        self.assertEqual(self.base.get('people', id=3), {'age': 35, 'id': 3, 'name': u'Moof'})
+        self.assertEqual(self.base.query_cache_info(), {'hits': 2, 'misses': 1, 'size': 1, 'max_size': 128})
+        
+        uncached = Bitty("sqlite://%s" % self.db_name, query_cache_size=0)
+        self.assertEqual(uncached.get('people', id=1), {'age': 27, 'id': 1, 'name': u'Daniel'})
+        self.assertEqual(uncached.query_cache_info(), None)
+        uncached.close()
+    
+    def test_stats(self):
+        self.assertEqual(self.base.stats(), {'queries': None, 'slow_queries': None, 'cache': None, 'pool': None, 'replicas': None})
+        
+        measured = Bitty("sqlite://%s" % self.db_name, collect_stats=True, slow_query_ms=0)
+        measured.find('people', id__in=[1, 2])
+        measured.find('people', id__in=[1, 2, 3])
+        self.assertEqual(len(list(measured.iter_find('people', chunk_size=2))), 3)
+        measured.add('test', text='foo')
+        self.assertRaises(sqlite3.OperationalError, measured.raw, "SELECT nope FROM people")
+        
+        stats = measured.stats()
+        queries = stats['queries']
+        self.assertEqual(queries['SELECT age, id, name FROM people WHERE id IN (...)']['count'], 2)
+        self.assertEqual(queries['SELECT age, id, name FROM people WHERE id IN (...)']['rows'], 5)
+        self.assertEqual(queries['SELECT age, id, name FROM people']['rows'], 3)
+        self.assertEqual(queries['INSERT INTO test (text) VALUES (...)']['count'], 1)
+        self.assertEqual(queries['SELECT nope FROM people']['errors'], 1)
+        # Including the schema introspection.
+        self.assertEqual(stats['slow_queries']['count'], 6)
+        self.assertEqual(stats['slow_queries']['recent'][-1]['query'], 'SELECT nope FROM people')
+        
+        class Recorder(QueryHook):
+            def __init__(self):
+                self.queries = []
+            
+            def before_execute(self, query, params):
+                self.queries.append(query)
+        
+        recorder = Recorder()
+        self.base.add_hook(recorder)
+        self.base.get('people', id=1)
+        self.base.remove_hook(recorder)
+        self.base.get('people', id=2)
+        self.assertEqual(recorder.queries, ['PRAGMA table_info(people)', 'SELECT age, id, name FROM people WHERE id = ? LIMIT ?'])
+        measured.close()
+    
+    def test_result_cache(self):
+        self.assertEqual(self.base.cache_stats(), None)
+        cached = Bitty("sqlite://%s" % self.db_name, cache=MemoryCache())
+        self.assertEqual(cached.get('people', id=1), {'age': 27, 'id': 1, 'name': u'Daniel'})
+        
+        # Writes from elsewhere aren't seen until the entry goes.
+        self.base.update('people', 1, age=28)
+        row = cached.get('people', id=1)
+        self.assertEqual(row, {'age': 27, 'id': 1, 'name': u'Daniel'})
+        row['age'] = 100
+        self.assertEqual(cached.get('people', id=1), {'age': 27, 'id': 1, 'name': u'Daniel'})
+        self.assertEqual(cached.cache_stats()['hits'], 2)
+        
+        # Writes through the same instance drop that table's results.
+        self.assertEqual(cached.find('test'), [{'id': 1, 'text': u'moof'}])
+        cached.update('people', 2, age=8)
+        self.assertEqual(cached.get('people', id=1), {'age': 28, 'id': 1, 'name': u'Daniel'})
+        self.assertEqual(cached.find('test'), [{'id': 1, 'text': u'moof'}])
+        cached.add('test', text='toast')
+        self.assertEqual(len(cached.find('test')), 2)
+        cached.delete('test', 2)
+        self.assertEqual(len(cached.find('test')), 1)
+        cached.add_many('test', [{'text': 'a'}, {'text': 'b'}])
+        self.assertEqual(len(cached.find('test')), 3)
+        
+        cached.get('people', id=3)
+        cached.raw("UPDATE people SET age = 36 WHERE id = 3;")
+        self.assertEqual(cached.get('people', id=3), {'age': 36, 'id': 3, 'name': u'Moof'})
+        
+        # Results read within a transaction aren't cached.
+        with cached.transaction():
+            cached.get('people', id=2)
+        
+        size = cached.cache_stats()['size']
+        self.assertEqual(cached.find('people', id__in=[1, 2]), [{'age': 28, 'id': 1, 'name': u'Daniel'}, {'age': 8, 'id': 2, 'name': u'Foo'}])
+        self.assertEqual(cached.cache_stats()['size'], size + 1)
+        self.assertEqual(cached.find('people', id=bytearray(b'1')), [])
+        self.assertEqual(cached.cache_stats()['size'], size + 1)
+        
+        # Rows a write made stale while the query ran aren't cached.
+        call = cached._call
+        
+        def racing_call(method, *args, **kwargs):
+            cached._call = call
+            results = call(method, *args, **kwargs)
+            cached.update('people', 1, age=29)
+            return results
+        
+        cached._call = racing_call
+        self.assertEqual(cached.get('people', id=1, name='Daniel')['age'], 28)
+        self.assertEqual(cached.get('people', id=1, name='Daniel')['age'], 29)
+        cached.close()
     
     def test_raw(self):
         self.assertEqual(self.base.raw("DELETE FROM people;").rowcount, 0)
@@ -135,6 +1226,81 @@ class SQLiteTestCase(unittest.TestCase):
         self.assertEqual(self.base.raw("UPDATE people SET name = 'Toast Driven' WHERE id = 1;").rowcount, 1)
         self.assertEqual(self.base.raw("DELETE FROM people WHERE id = 1;").rowcount, 1)
     
+    def test_transaction(self):
+        alternate = Bitty("sqlite://%s" % self.db_name)
+        
+        with self.base.transaction():
+            self.assertEqual(self.base.add('people', name='Toasty'), True)
+            self.assertEqual(self.base.update('people', 1, age=28), True)
+            self.assertEqual(self.base.get('people', id=4), {'age': None, 'id': 4, 'name': u'Toasty'})
+        
+        self.assertEqual(alternate.get('people', id=4), {'age': None, 'id': 4, 'name': u'Toasty'})
+        self.assertEqual(alternate.get('people', id=1), {'age': 28, 'id': 1, 'name': u'Daniel'})
+        
+        try:
+            with self.base.transaction():
+                self.base.add('people', name='Rolled Back')
+                self.base.delete('people', 1)
+                raise ValueError("Oops.")
+        except ValueError:
+            pass
+        
+        self.assertEqual(len(self.base.find('people')), 4)
+        self.assertEqual(self.base.get('people', name='Rolled Back'), None)
+        alternate.close()
+    
+    def test_nested_transaction(self):
+        with self.base.transaction():
+            self.base.add('people', name='Outer')
+            
+            try:
+                with self.base.transaction():
+                    self.base.add('people', name='Inner')
+                    self.assertEqual(len(self.base.find('people')), 5)
+                    raise ValueError("Oops.")
+            except ValueError:
+                pass
+            
+            with self.base.transaction():
+                self.base.add('people', name='Second Inner')
+        
+        self.assertEqual([row['name'] for row in self.base.find('people', id__gt=3)], [u'Outer', u'Second Inner'])
+        
+        with self.base.transaction():
+            self.assertRaises(QueryError, self.base.commit)
+    
+    def test_commit_batching(self):
+        batched = Bitty("sqlite://%s" % self.db_name, commit_every=3)
+        alternate = Bitty("sqlite://%s" % self.db_name)
+        
+        batched.add('people', name='One')
+        batched.add('people', name='Two')
+        self.assertEqual(len(alternate.find('people')), 3)
+        batched.add('people', name='Three')
+        # Committed by the statement that fills the batch, with nothing
+        # following it.
+        self.assertEqual(len(alternate.find('people')), 6)
+        self.assertEqual(batched.adapter._uncommitted, 0)
+        
+        batched.add('people', name='Four')
+        self.assertEqual(len(alternate.find('people')), 6)
+        batched.commit()
+        self.assertEqual(len(alternate.find('people')), 7)
+        
+        # A failing statement only undoes itself, not the batch so far.
+        self.assertEqual(batched.add('people', name='Six'), True)
+        self.assertEqual(batched.add('people', name='Seven'), True)
+        self.assertRaises(sqlite3.IntegrityError, batched.add, 'people', id=1, name='Duplicate')
+        batched.commit()
+        self.assertEqual(alternate.count('people', name__in=['Six', 'Seven']), 2)
+        
+        # A health check doesn't throw away the batch.
+        batched.add('people', name='Five')
+        self.assertEqual(batched.adapter.ping(), True)
+        batched.close()
+        self.assertEqual(len(alternate.find('people')), 10)
+        alternate.close()
+    
     def test_regression_commit(self):
         self.assertEqual(self.base.add('people', name='Toasty'), True)
         
@@ -142,6 +1308,546 @@ class SQLiteTestCase(unittest.TestCase):
         self.assertEqual(alternate.find('people', name='Toasty'), [{'age': None, 'id': 4, 'name': u'Toasty'}])
 
 
+class MemoryTestCase(unittest.TestCase):
+    dsn = 'memory://bitty_test'
+    
+    def setUp(self):
+        super(MemoryTestCase, self).setUp()
+        self.base = Bitty(self.dsn)
+        self.base.add('people', id=1, name='Daniel', age=27)
+        self.base.add('people', id=2, name='Foo', age=7)
+        self.base.add('people', id=3, name='Moof', age=35)
+        self.base.add('test', id=1, text='moof')
+    
+    def tearDown(self):
+        self.base.close()
+        super(MemoryTestCase, self).tearDown()
+    
+    def test_get_adapter(self):
+        self.assertRaises(InvalidDSN, self.base.get_adapter, 'memory:/')
+        adapter = self.base.get_adapter(self.dsn)
+        self.assert_(isinstance(adapter, MemoryAdapter))
+        self.assert_(adapter.connection is self.base.adapter.connection)
+        adapter.close()
+        
+        # Without a name, the tables are private to the adapter.
+        private = self.base.get_adapter('memory://')
+        self.assert_(private.connection is not self.base.adapter.connection)
+        other = self.base.get_adapter('memory://')
+        self.assert_(private.connection is not other.connection)
+        private.close()
+        other.close()
+    
+    def test_close(self):
+        alternate = Bitty(self.dsn)
+        self.assertEqual(len(alternate.find('people')), 3)
+        alternate.close()
+        self.assertEqual(len(self.base.find('people')), 3)
+        self.base.close()
+        
+        # The tables go with the last adapter using them.
+        self.base = Bitty(self.dsn)
+        self.assertRaises(QueryError, self.base.find, 'people')
+    
+    def test_add(self):
+        self.assertEqual(self.base.add('people', name='Daniel'), True)
+        self.assertEqual(self.base.add('people', name='Daniel', age=27), True)
+        self.assertRaises(QueryError, self.base.add, 'people', id=1, name='Daniel')
+        self.assertRaises(QueryError, self.base.add, 'people')
+        self.assertEqual(self.base.find('people', id__gt=3), [{'age': None, 'id': 4, 'name': u'Daniel'}, {'age': 27, 'id': 5, 'name': u'Daniel'}])
+        self.assertEqual(self.base.add('test', text='foo', extra=True), True)
+        self.assertEqual(self.base.get('test', id=1), {'extra': None, 'id': 1, 'text': u'moof'})
+    
+    def test_add_many(self):
+        self.assertEqual(self.base.add_many('people', []), 0)
+        self.assertEqual(self.base.add_many('people', [{'name': 'Bar', 'age': 1}, {'name': 'Baz'}, {'name': 'Qux', 'age': 3}], batch_size=2), 3)
+        self.assertEqual(self.base.find('people', id__gt=3), [{'age': 1, 'id': 4, 'name': u'Bar'}, {'age': 3, 'id': 5, 'name': u'Qux'}, {'age': None, 'id': 6, 'name': u'Baz'}])
+        self.assertRaises(QueryError, self.base.add_many, 'test', [{}])
+        self.assertRaises(QueryError, self.base.add_many, 'test', [{'text': 'foo'}], copy=True)
+        # Batches are all-or-nothing.
+        self.assertRaises(QueryError, self.base.add_many, 'people', [{'id': 10, 'name': 'New'}, {'id': 1, 'name': 'Daniel'}])
+        self.assertEqual(len(self.base.find('people')), 6)
+    
+    def test_buffered(self):
+        writer = self.base.buffered('test', max_rows=10, max_delay_ms=50)
+        
+        for i in range(25):
+            writer.add(text='row %s' % i)
+        
+        self.assertEqual(writer.flush(timeout=5), True)
+        self.assertEqual(self.base.count('test'), 26)
+        
+        # Only the bad rows are lost.
+        writer.add(text='good')
+        writer.add(id=1, text='duplicate')
+        writer.add(text='also good')
+        writer.flush()
+        self.assertEqual(self.base.count('test'), 28)
+        report = writer.report()
+        self.assertEqual((report['queued'], report['written'], report['failed'], report['pending']), (28, 27, 1, 0))
+        self.assertEqual(report['failures'][0][0], {'id': 1, 'text': 'duplicate'})
+        self.assert_(isinstance(report['failures'][0][1], QueryError))
+        
+        # Written once the delay is up, without a flush.
+        writer.add(text='later')
+        time.sleep(0.5)
+        self.assertEqual(self.base.count('test'), 29)
+        writer.close()
+        self.assertRaises(QueryError, writer.add, text='closed')
+        
+        # Closing the instance writes whatever's left.
+        bit = Bitty(self.dsn)
+        writer = bit.buffered('test', max_delay_ms=60000)
+        writer.add(text='last')
+        bit.close()
+        self.assertEqual(self.base.count('test'), 30)
+        
+        # Backpressure, with the writer stopped.
+        writer = self.base.buffered('test', max_queued=1, timeout=0.01)
+        writer.queue.put(None)
+        writer._thread.join()
+        writer.add(text='waiting')
+        self.assertRaises(BufferFull, writer.add, text='full')
+    
+    def test_update(self):
+        self.assertEqual(self.base.update('people', 1, name='Daniel'), True)
+        self.assertEqual(self.base.update('people', 2, name='Daniel', age=27), True)
+        self.assertEqual(self.base.update('people', 10, name='Daniel'), False)
+        self.assertEqual(self.base.find('people', name='Daniel', order_by='id'), [{'age': 27, 'id': 1, 'name': u'Daniel'}, {'age': 27, 'id': 2, 'name': u'Daniel'}])
+        self.assertRaises(QueryError, self.base.update, 'people', 1, id=2)
+        self.assertRaises(QueryError, self.base.update, 'nope', 1, name='Daniel')
+    
+    def test_delete(self):
+        self.assertEqual(self.base.delete('people', 1), True)
+        self.assertEqual(self.base.delete('people', 2), True)
+        self.assertEqual(self.base.delete('people', 10), False)
+        self.assertEqual(self.base.delete('test', '100'), False)
+        self.assertEqual(self.base.find('people'), [{'age': 35, 'id': 3, 'name': u'Moof'}])
+        # Ids aren't reused.
+        self.base.delete('people', 3)
+        self.base.add('people', name='Toasty')
+        self.assertEqual(self.base.find('people'), [{'age': None, 'id': 4, 'name': u'Toasty'}])
+    
+    def test_update_where(self):
+        self.assertEqual(self.base.update_where('people', {'age': 30}, age__gte=20), 2)
+        self.assertEqual([row['age'] for row in self.base.find('people', order_by='id')], [30, 7, 30])
+        self.assertEqual(self.base.update_where('people', {'name': 'Nobody'}, name__startswith='Nope'), 0)
+        self.assertEqual(self.base.update_where('people', {'name': 'Both', 'age': 1}, id__in=[1, 2]), 2)
+        self.assertEqual(self.base.find('people', name='Both', order_by='id'), [{'age': 1, 'id': 1, 'name': u'Both'}, {'age': 1, 'id': 2, 'name': u'Both'}])
+        self.assertRaises(QueryError, self.base.update_where, 'people', {'age': 1})
+        self.assertRaises(QueryError, self.base.update_where, 'people', {}, id=1)
+    
+    def test_delete_where(self):
+        self.assertEqual(self.base.delete_where('people', age__lt=30), 2)
+        self.assertEqual(self.base.find('people'), [{'age': 35, 'id': 3, 'name': u'Moof'}])
+        self.assertEqual(self.base.delete_where('people', name='Nope'), 0)
+        self.assertRaises(QueryError, self.base.delete_where, 'people')
+        self.assertEqual(self.base.delete_many('people', []), 0)
+        self.assertEqual(self.base.delete_many('people', [3, 10]), 1)
+        self.assertEqual(self.base.find('people'), [])
+        
+        # Statements are all-or-nothing.
+        self.base.add_many('people', [{'name': 'One'}, {'name': 'Two'}])
+        self.assertRaises(QueryError, self.base.update_where, 'people', {'id': 100}, id__gt=3)
+        self.assertEqual([row['id'] for row in self.base.find('people')], [4, 5])
+    
+    def test_upsert(self):
+        self.assertEqual(self.base.upsert('people', 'id', id=1, name='Daniel', age=28), True)
+        self.assertEqual(self.base.upsert('people', ['id'], id=4, name='Bar', age=1), True)
+        self.assertEqual(self.base.find('people', id__in=[1, 4], order_by='id'), [{'age': 28, 'id': 1, 'name': u'Daniel'}, {'age': 1, 'id': 4, 'name': u'Bar'}])
+        # Only the key leaves an existing row alone.
+        self.assertEqual(self.base.upsert('people', 'id', id=2), True)
+        self.assertEqual(self.base.find('people', id=2), [{'age': 7, 'id': 2, 'name': u'Foo'}])
+        self.assertRaises(QueryError, self.base.upsert, 'people', 'id')
+        self.assertRaises(QueryError, self.base.upsert, 'people', [], name='Daniel')
+        self.assertRaises(QueryError, self.base.upsert, 'people', 'id', name='Daniel')
+    
+    def test_upsert_many(self):
+        self.assertEqual(self.base.upsert_many('people', 'id', []), 0)
+        self.assertEqual(self.base.upsert_many('people', 'id', [{'id': 2, 'age': 8}, {'id': 5, 'name': 'Baz', 'age': 2}, {'id': 3, 'age': 36}, {'id': 2, 'age': 9}], batch_size=2), 4)
+        self.assertEqual(self.base.find('people', order_by='id'), [{'age': 27, 'id': 1, 'name': u'Daniel'}, {'age': 9, 'id': 2, 'name': u'Foo'}, {'age': 36, 'id': 3, 'name': u'Moof'}, {'age': 2, 'id': 5, 'name': u'Baz'}])
+        self.assertRaises(QueryError, self.base.upsert_many, 'people', 'id', [{'name': 'Nope'}])
+        # Counted as given, though only the last row per key is written.
+        self.assertEqual(self.base.upsert_many('people', 'id', [{'id': 1, 'age': 28}, {'id': 1, 'age': 29}]), 2)
+        self.assertEqual(self.base.get('people', id=1)['age'], 29)
+    
+    def test_upsert_columns(self):
+        # Any columns can be the key, as there are no constraints to check.
+        self.assertEqual(self.base.upsert('people', 'name', name='Foo', age=8), True)
+        self.assertEqual(self.base.upsert('people', ['name', 'age'], name='Foo', age=9), True)
+        self.assertEqual(self.base.find('people', name='Foo', order_by='id'), [{'age': 8, 'id': 2, 'name': u'Foo'}, {'age': 9, 'id': 4, 'name': u'Foo'}])
+        self.assertEqual(self.base.upsert('new', 'slug', slug='a', hits=1), True)
+        self.assertEqual(self.base.upsert('new', 'slug', slug='a', hits=2), True)
+        self.assertEqual(self.base.find('new'), [{'hits': 2, 'id': 1, 'slug': u'a'}])
+    
+    def test_find(self):
+        self.assertEqual(self.base.find('people'), [{'age': 27, 'id': 1, 'name': u'Daniel'}, {'age': 7, 'id': 2, 'name': u'Foo'}, {'age': 35, 'id': 3, 'name': u'Moof'}])
+        self.assertEqual(self.base.find('people', id=1), [{'age': 27, 'id': 1, 'name': u'Daniel'}])
+        self.assertEqual(self.base.find('people', name='Daniel'), [{'age': 27, 'id': 1, 'name': u'Daniel'}])
+        self.assertEqual(self.base.find('people', id=1, name='Daniel'), [{'age': 27, 'id': 1, 'name': u'Daniel'}])
+        self.assertEqual(self.base.find('test', text='Daniel'), [])
+        self.assertRaises(QueryError, self.base.find, 'nope')
+        self.assertRaises(QueryError, self.base.find, 'people', nope=1)
+        
+        # Test advanced lookups.
+        self.assertEqual(self.base.find('people', id__gte=1), [{'age': 27, 'id': 1, 'name': u'Daniel'}, {'age': 7, 'id': 2, 'name': u'Foo'}, {'age': 35, 'id': 3, 'name': u'Moof'}])
+        self.assertEqual(self.base.find('people', id__gte=1, name__startswith='Dan'), [{'age': 27, 'id': 1, 'name': u'Daniel'}])
+        self.assertEqual(self.base.find('people', name__contains='a'), [{'age': 27, 'id': 1, 'name': u'Daniel'}])
+        self.assertEqual([row['id'] for row in self.base.find('people', id__in=[3, 1, 10])], [1, 3])
+        self.assertEqual([row['id'] for row in self.base.find('people', age__lt=27)], [2])
+        self.assertEqual([row['id'] for row in self.base.find('people', age__lte=27)], [1, 2])
+        self.assertEqual([row['id'] for row in self.base.find('people', age__gt=27)], [3])
+        self.assertEqual([row['id'] for row in self.base.find('people', name__endswith='OF')], [3])
+        self.assertEqual([row['id'] for row in self.base.find('people', name__startswith='m_o')], [3])
+        
+        # ``NULL`` never matches, as in SQL.
+        self.base.add('people', name='Nobody')
+        self.assertEqual([row['id'] for row in self.base.find('people', age__lt=100)], [1, 2, 3])
+        self.assertEqual(self.base.find('people', age=None), [])
+    
+    def test_find_ordering(self):
+        self.assertEqual([row['id'] for row in self.base.find('people', order_by='age')], [2, 1, 3])
+        self.assertEqual([row['id'] for row in self.base.find('people', order_by='-age')], [3, 1, 2])
+        self.assertEqual([row['id'] for row in self.base.find('people', order_by='id', limit=2)], [1, 2])
+        self.assertEqual([row['id'] for row in self.base.find('people', order_by='id', limit=2, offset=2)], [3])
+        self.assertEqual([row['id'] for row in self.base.find('people', order_by='id', offset=1)], [2, 3])
+        self.assertEqual([row['id'] for row in self.base.find('people', order_by='-age', after=27)], [2])
+        self.assertEqual([row['id'] for row in self.base.find('people', id__lt=3, order_by=['age', 'id'], after=(7, 2))], [1])
+        self.assertRaises(QueryError, self.base.find, 'people', order_by='nope')
+        self.assertRaises(QueryError, self.base.find, 'people', after=1)
+        
+        self.base.add('people', name='Daniel', age=40)
+        self.assertEqual([row['id'] for row in self.base.find('people', order_by=['name', '-age'])], [4, 1, 2, 3])
+    
+    def test_find_chunked_in(self):
+        bit = Bitty(self.dsn, in_chunk_size=2)
+        bit.add_many('people', [{'name': 'Person %s' % i, 'age': i} for i in range(4, 10)])
+        ids = [9, 1, 2, 3, 4, 5, 2, 100]
+        self.assertEqual(sorted([row['id'] for row in bit.find('people', id__in=ids)]), [1, 2, 3, 4, 5, 9])
+        self.assertEqual([row['id'] for row in bit.find('people', id__in=ids, order_by='-age')], [3, 1, 9, 2, 5, 4])
+        self.assertEqual(bit.find('people', id__in=ids, order_by=['age'], fields=['name'], limit=2, offset=1), [{'name': u'Person 5'}, {'name': u'Foo'}])
+        self.assertEqual(bit.find('people', id__in=ids, age__lt=5, row_factory='tuple'), [(4, 4, u'Person 4')])
+        self.assertEqual(sorted([row['id'] for row in bit.iter_find('people', id__in=ids, chunk_size=1)]), [1, 2, 3, 4, 5, 9])
+        self.assertEqual([row['id'] for row in bit.iter_find('people', id__in=ids, order_by='id', limit=3)], [1, 2, 3])
+        self.assertEqual(bit.count('people', id__in=ids), 6)
+        self.assertEqual(bit.exists('people', id__in=[100, 101, 102, 9]), True)
+        self.assertEqual(bit.update_where('people', {'age': 0}, id__in=ids), 6)
+        self.assertEqual(bit.delete_many('people', ids), 6)
+        self.assertEqual(bit.count('people'), 3)
+        bit.close()
+    
+    def test_find_fields(self):
+        self.assertEqual(self.base.find('people', fields=['id', 'name'], age__gte=20, order_by='id'), [{'id': 1, 'name': u'Daniel'}, {'id': 3, 'name': u'Moof'}])
+        self.assertEqual(self.base.find('people', fields=['name'], id=2, row_factory='tuple'), [(u'Foo',)])
+        self.assertEqual(self.base.get('people', fields=['age'], name='Moof'), {'age': 35})
+        self.assertEqual(list(self.base.iter_find('people', fields=['name', 'id'], chunk_size=2)), [{'id': 1, 'name': u'Daniel'}, {'id': 2, 'name': u'Foo'}, {'id': 3, 'name': u'Moof'}])
+        row = self.base.get('people', fields=['name'], id=1, row_factory='namedtuple')
+        self.assertEqual(row.name, u'Daniel')
+        self.assertRaises(AttributeError, getattr, row, 'age')
+        self.assertRaises(QueryError, self.base.find, 'people', fields=['text'])
+    
+    def test_search(self):
+        self.base.create_search_index('people', 'name')
+        self.base.add_many('people', [{'name': 'Toast Driven'}, {'name': 'Driven Daniel Driven'}])
+        self.assertEqual([row['id'] for row in self.base.find('people', name__search='driven', order_by='id')], [4, 5])
+        self.assertEqual([row['id'] for row in self.base.find('people', name__search='daniel driven')], [5])
+        self.assertEqual([row['id'] for row in self.base.find('people', name__search='Daniel', order_by='id')], [1, 5])
+        # Most relevant first.
+        self.assertEqual([row['id'] for row in self.base.find('people', name__search='driven', order_by='name__search')], [5, 4])
+        self.assertEqual(self.base.count('people', name__search='driven'), 2)
+        # No words to look for, so nothing matches.
+        self.assertEqual(self.base.find('people', name__search=''), [])
+        self.assertEqual(self.base.find('people', name__search='   ', order_by='name__search'), [])
+        self.assertEqual(self.base.count('people', name__search='!!'), 0)
+        self.base.update('people', 4, name='Burnt')
+        self.base.delete('people', 5)
+        self.assertEqual(self.base.find('people', name__search='driven'), [])
+        self.assertEqual(self.base.find('people', name__search='burnt'), [{'age': None, 'id': 4, 'name': u'Burnt'}])
+        self.assertRaises(QueryError, self.base.find, 'people', order_by='name__search')
+    
+    def test_iter_find(self):
+        results = self.base.iter_find('people')
+        self.assertEqual(next(results), {'age': 27, 'id': 1, 'name': u'Daniel'})
+        self.assertEqual(list(results), [{'age': 7, 'id': 2, 'name': u'Foo'}, {'age': 35, 'id': 3, 'name': u'Moof'}])
+        self.assertEqual(list(self.base.iter_find('people', chunk_size=2)), self.base.find('people'))
+        self.assertEqual(list(self.base.iter_find('people', chunk_size=1, id__gte=2)), [{'age': 7, 'id': 2, 'name': u'Foo'}, {'age': 35, 'id': 3, 'name': u'Moof'}])
+        self.assertEqual(list(self.base.iter_find('test', text='Daniel')), [])
+        
+        # Rows deleted along the way are skipped.
+        results = self.base.iter_find('people', chunk_size=1)
+        self.assertEqual(next(results)['id'], 1)
+        self.base.delete('people', 2)
+        self.assertEqual([row['id'] for row in results], [3])
+    
+    def test_count(self):
+        self.assertEqual(self.base.count('people'), 3)
+        self.assertEqual(self.base.count('people', age__gte=20), 2)
+        self.assertEqual(self.base.count('people', name='Nope'), 0)
+        self.assertEqual(self.base.exists('people', name='Foo'), True)
+        self.assertEqual(self.base.exists('people', name__in=['Nope', 'Nada']), False)
+    
+    def test_aggregate(self):
+        self.assertEqual(self.base.aggregate('people', sum='age', min='age', max=['age', 'name']), {'age__max': 35, 'age__min': 7, 'age__sum': 69, 'name__max': u'Moof'})
+        self.assertEqual(self.base.aggregate('people', avg='age'), {'age__avg': 23})
+        self.assertEqual(self.base.aggregate('people', max='age', name='Nope'), {'age__max': None})
+        self.base.add('people', name='Foo', age=9)
+        self.assertEqual(self.base.aggregate('people', sum='age', max='id', group_by='name', age__lt=30), [{'age__sum': 27, 'id__max': 1, 'name': u'Daniel'}, {'age__sum': 16, 'id__max': 4, 'name': u'Foo'}])
+        self.assertRaises(QueryError, self.base.aggregate, 'people', group_by='name')
+        self.assertRaises(QueryError, self.base.aggregate, 'people', sum='nope')
+    
+    def test_get(self):
+        self.assertEqual(self.base.get('people', name='Daniel'), {'age': 27, 'id': 1, 'name': u'Daniel'})
+        self.assertEqual(self.base.get('people', id=1, name='Daniel', age=27), {'age': 27, 'id': 1, 'name': u'Daniel'})
+        self.assertEqual(self.base.get('people', name='Nope'), None)
+        self.assertEqual(self.base.get('people', id=1, row_factory='tuple'), (27, 1, u'Daniel'))
+    
+    def test_find_columns(self):
+        columns = self.base.find_columns('people', columns=['id', 'age'], age__gt=10)
+        self.assertEqual(sorted(columns.keys()), ['age', 'id'])
+        self.assertEqual(list(columns['id']), [1, 3])
+        self.assertEqual(list(columns['age']), [27, 35])
+    
+    def test_indexes(self):
+        self.base.add_many('people', [{'name': 'Person %s' % i, 'age': i % 50} for i in range(200)])
+        lookups = [
+            {'age': 27},
+            {'age__in': [7, 35, 99]},
+            {'age__lt': 10},
+            {'age__lte': 10},
+            {'age__gt': 45},
+            {'age__gte': 45},
+            {'name__startswith': 'person 1'},
+            {'name__endswith': '99'},
+            {'name__contains': 'on 12'},
+            {'name__startswith': 'Dan', 'age__gte': 20},
+            {'id__in': [1, 2, 150]},
+        ]
+        scanned = [self.base.find('people', **lookup) for lookup in lookups]
+        self.assertEqual(self.base.create_index('people', 'name', kind='sorted'), None)
+        self.base.create_index('people', 'age', kind='hash')
+        self.assertEqual([self.base.find('people', **lookup) for lookup in lookups], scanned)
+        self.base.create_index('people', 'age', kind='sorted')
+        self.assertEqual([self.base.find('people', **lookup) for lookup in lookups], scanned)
+        self.assertRaises(QueryError, self.base.create_index, 'people', 'age', kind='nope')
+        
+        # Indexes keep up with writes.
+        self.base.update('people', 1, age=99)
+        self.base.delete('people', 2)
+        self.assertEqual([row['id'] for row in self.base.find('people', age__in=[98, 99])], [1])
+        self.assertEqual([row['id'] for row in self.base.find('people', name__startswith='foo')], [])
+        self.assertEqual(self.base.adapter.connection.get_table('people').indexes['age'].search('gt', 98), set([1]))
+    
+    def test_raw(self):
+        self.assertRaises(QueryError, self.base.raw, "DELETE FROM people;")
+    
+    def test_transaction(self):
+        with self.base.transaction():
+            self.assertEqual(self.base.add('people', name='Toasty'), True)
+            self.assertEqual(self.base.update('people', 1, age=28), True)
+        
+        self.assertEqual(self.base.get('people', id=4), {'age': None, 'id': 4, 'name': u'Toasty'})
+        
+        try:
+            with self.base.transaction():
+                self.base.add('people', name='Rolled Back')
+                self.base.delete('people', 2)
+                self.base.update('people', 1, age=50, id=10)
+                
+                with self.base.transaction():
+                    self.base.add('people', name='Inner')
+                
+                raise ValueError("Oops.")
+        except ValueError:
+            pass
+        
+        self.assertEqual(self.base.find('people', order_by='id'), [{'age': 28, 'id': 1, 'name': u'Daniel'}, {'age': 7, 'id': 2, 'name': u'Foo'}, {'age': 35, 'id': 3, 'name': u'Moof'}, {'age': None, 'id': 4, 'name': u'Toasty'}])
+        self.assertEqual(self.base.add('people', name='Next'), True)
+        # Ids handed out in a rolled back transaction aren't reused.
+        self.assertEqual(self.base.get('people', name='Next')['id'], 12)
+        
+        with self.base.transaction():
+            self.assertRaises(QueryError, self.base.commit)
+    
+    def test_rollback_order(self):
+        try:
+            with self.base.transaction():
+                self.base.delete('people', 2)
+                self.base.delete('people', 1)
+                raise ValueError("Oops.")
+        except ValueError:
+            pass
+        
+        # Back where they were, not on the end.
+        self.assertEqual([row['id'] for row in self.base.find('people')], [1, 2, 3])
+        
+        # Deleted rows are only compacted away once nothing can be undone.
+        memory_table = self.base.adapter.connection.get_table('people')
+        self.base.add_many('people', [{'name': 'Row %s' % i} for i in range(1100)])
+        
+        with self.base.transaction():
+            self.assertEqual(self.base.delete_where('people', id__gt=3), 1100)
+            self.assertEqual(memory_table.dead, 1100)
+        
+        self.assertEqual(memory_table.dead, 0)
+        self.assertEqual([row['id'] for row in self.base.find('people')], [1, 2, 3])
+    
+    def test_shared_rollback(self):
+        # Another adapter on the same store commits while this one's
+        # transaction is open.
+        other = Bitty(self.dsn)
+        
+        try:
+            with self.base.transaction():
+                self.base.add('people', name='Rolled Back')
+                self.base.update('people', 1, age=30)
+                self.base.update('people', 2, age=40)
+                other.add('people', name='Committed')
+                other.update('people', 1, age=31)
+                raise ValueError("Oops.")
+        except ValueError:
+            pass
+        
+        # The other adapter's update stays, while the row it left alone is
+        # put back.
+        self.assertEqual([row['age'] for row in self.base.find('people', id__in=[1, 2], order_by='id')], [31, 7])
+        self.base.add('people', name='After')
+        self.base.add('people', name='Later')
+        other.close()
+        rows = self.base.find('people', id__gt=3)
+        self.assertEqual([(row['id'], row['name']) for row in rows], [(5, u'Committed'), (6, u'After'), (7, u'Later')])
+        self.assertEqual(self.base.count('people', id=5), 1)
+    
+    def test_commit_batching(self):
+        batched = Bitty(self.dsn, commit_every=2)
+        
+        batched.add('people', name='One')
+        self.assertEqual(self.base.adapter.connection.uncommitted, 1)
+        batched.add('people', name='Two')
+        self.assertEqual(self.base.adapter.connection.uncommitted, 0)
+        batched.add('people', name='Three')
+        batched.close()
+        self.assertEqual(len(self.base.find('people')), 6)
+    
+    def test_pool(self):
+        pooled = Bitty(self.dsn, pool_size=2)
+        errors = []
+        
+        def worker(count):
+            try:
+                for step in range(20):
+                    pooled.add('test', text='%s-%s' % (count, step))
+                    pooled.find('test', text__startswith='%s-' % count)
+            except Exception as e:
+                errors.append(e)
+        
+        threads = [threading.Thread(target=worker, args=(count,)) for count in range(4)]
+        
+        for thread in threads:
+            thread.start()
+        
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(errors, [])
+        self.assertEqual(len(self.base.find('test')), 81)
+        pooled.close()
+
+
+class JSONTestCase(MemoryTestCase):
+    # The JSON adapter is the memory adapter plus a log, so all of the same
+    # tests apply.
+    dsn = 'json:///tmp/bitty_test.jsonl'
+    
+    def setUp(self):
+        self.db_name = '/tmp/bitty_test.jsonl'
+        
+        if os.path.exists(self.db_name):
+            os.remove(self.db_name)
+        
+        super(JSONTestCase, self).setUp()
+    
+    def test_get_adapter(self):
+        self.assertRaises(InvalidDSN, self.base.get_adapter, 'json:/')
+        adapter = self.base.get_adapter("json://%s" % self.db_name)
+        self.assert_(isinstance(adapter, JSONAdapter))
+        self.assert_(adapter.connection is self.base.adapter.connection)
+        adapter.close()
+    
+    def test_close(self):
+        self.base.close()
+        self.base = Bitty(self.dsn)
+        self.assertEqual(len(self.base.find('people')), 3)
+    
+    def test_persistence(self):
+        self.base.update('people', 1, age=28)
+        self.base.delete('people', 2)
+        self.base.create_index('people', 'age', kind='sorted')
+        
+        try:
+            with self.base.transaction():
+                self.base.add('people', name='Rolled Back')
+                raise ValueError("Oops.")
+        except ValueError:
+            pass
+        
+        rows = self.base.find('people')
+        self.base.close()
+        
+        self.base = Bitty("json://%s" % self.db_name)
+        self.assertEqual(self.base.find('people'), rows)
+        self.assertEqual(self.base.find('test'), [{'id': 1, 'text': u'moof'}])
+        self.assertEqual(sorted(self.base.adapter.connection.get_table('people').indexes), ['age'])
+        
+        # A write cut off part way is dropped.
+        self.base.close()
+        
+        with open(self.db_name, 'ab') as log:
+            log.write(b'{"op":"add","table":"test","ro')
+        
+        self.base = Bitty("json://%s" % self.db_name)
+        self.assertEqual(self.base.find('people'), rows)
+        self.base.add('test', text='after')
+        self.base.close()
+        
+        self.base = Bitty("json://%s" % self.db_name)
+        self.assertEqual([row['text'] for row in self.base.find('test')], [u'moof', u'after'])
+        
+        # Bytes come back as bytes, not their repr.
+        self.base.add('test', text=b'\x00\x01')
+        self.base.add('test', text=bytearray(b'\xff'))
+        self.base.close()
+        
+        self.base = Bitty("json://%s" % self.db_name)
+        self.assertEqual([row['text'] for row in self.base.find('test', id__gt=2)], [b'\x00\x01', b'\xff'])
+    
+    def test_shared_rollback(self):
+        super(JSONTestCase, self).test_shared_rollback()
+        rows = self.base.find('people')
+        self.base.close()
+        
+        # Replaying the log gives back the committed rows.
+        self.base = Bitty(self.dsn)
+        self.assertEqual(self.base.find('people'), rows)
+    
+    def test_compaction(self):
+        store = self.base.adapter.connection
+        
+        for count in range(JSONStore.COMPACT_MIN_RECORDS):
+            self.base.update('test', 1, text='moof %s' % count)
+        
+        self.assert_(store.records < 20)
+        
+        with open(self.db_name, 'rb') as log:
+            self.assertEqual(len(log.readlines()), store.records)
+        
+        self.base.close()
+        self.base = Bitty("json://%s" % self.db_name)
+        self.assertEqual(self.base.get('test', id=1), {'id': 1, 'text': u'moof %s' % (JSONStore.COMPACT_MIN_RECORDS - 1)})
+        self.assertEqual(len(self.base.find('people')), 3)
+        self.base.add('people', name='Toasty')
+        self.assertEqual(self.base.get('people', name='Toasty')['id'], 4)
+
+
 class PostgresTestCase(unittest.TestCase):
     def setUp(self):
         super(PostgresTestCase, self).setUp()
@@ -176,6 +1882,14 @@ class PostgresTestCase(unittest.TestCase):
         self.assert_(isinstance(self.base.get_adapter("postgres://postgres:@localhost:/bitty_test"), PostgresAdapter))
         self.assert_(isinstance(self.base.get_adapter("postgres://postgres:@localhost:5432/bitty_test"), PostgresAdapter))
     
+    def test_ping(self):
+        adapter = self.base.get_adapter()
+        self.assertEqual(adapter.ping(), True)
+        # Dropped by the server, but still open as far as psycopg2 knows.
+        self.base.raw("SELECT pg_terminate_backend(%s)", params=[adapter.connection.get_backend_pid()])
+        self.assertEqual(adapter.connection.closed, 0)
+        self.assertEqual(adapter.ping(), False)
+    
     def test_add(self):
         self.assertEqual(self.base.add('people', name='Daniel'), True)
         self.assertEqual(self.base.add('people', name='Daniel', age=27), True)
@@ -183,6 +1897,183 @@ class PostgresTestCase(unittest.TestCase):
         self.assertEqual(self.base.add('people', name='Daniel'), True)
         self.assertEqual(self.base.add('test', text='foo'), True)
     
+    def test_add_many(self):
+        self.assertEqual(self.base.add_many('people', []), 0)
+        self.assertEqual(self.base.add_many('people', [{'name': 'Bar', 'age': 1}, {'name': 'Baz'}, {'name': 'Qux', 'age': 3}], batch_size=2), 3)
+        self.assertEqual(self.base.find('people', id__gt=3), [{'age': 1, 'id': 4, 'name': u'Bar'}, {'age': 3, 'id': 5, 'name': u'Qux'}, {'age': None, 'id': 6, 'name': u'Baz'}])
+        self.assertEqual(self.base.add_many('test', [{'text': 'with "quotes", commas'}, {'text': ''}, {'text': None}], copy=True), 3)
+        self.assertEqual(self.base.find('test', id__gt=1), [{'id': 2, 'text': u'with "quotes", commas'}, {'id': 3, 'text': u''}, {'id': 4, 'text': None}])
+    
+    def test_add_many_copy_types(self):
+        self.base.raw("""DROP TABLE IF EXISTS blobs;""")
+        self.base.raw("""CREATE TABLE blobs (id SERIAL UNIQUE, data BYTEA NULL, flag BOOLEAN NULL, created TIMESTAMP NULL);""")
+        created = datetime.datetime(2011, 3, 4, 5, 6, 7, 890)
+        rows = [
+            {'data': b'\x00\xff"quoted",\n', 'flag': True, 'created': created},
+            {'data': memoryview(b'view'), 'flag': False, 'created': None},
+            {'data': None, 'flag': None, 'created': created},
+        ]
+        self.assertEqual(self.base.add_many('blobs', rows, copy=True), 3)
+        found = self.base.find('blobs', order_by='id')
+        self.assertEqual([bytes(row['data']) if row['data'] is not None else None for row in found], [b'\x00\xff"quoted",\n', b'view', None])
+        self.assertEqual([row['flag'] for row in found], [True, False, None])
+        self.assertEqual([row['created'] for row in found], [created, None, created])
+        
+        # Types COPY can't be handed as text go in the usual way instead.
+        self.base.raw("""ALTER TABLE blobs ADD COLUMN tags TEXT[] NULL;""")
+        self.base.refresh_schema('blobs')
+        self.assertEqual(self.base.add_many('blobs', [{'tags': ['a', 'b,c']}], copy=True), 1)
+        self.assertEqual(self.base.get('blobs', id=4)['tags'], ['a', 'b,c'])
+        self.base.raw("""DROP TABLE blobs;""")
+    
+    def test_buffered(self):
+        writer = self.base.buffered('test', max_rows=10, max_delay_ms=50)
+        
+        for i in range(25):
+            writer.add(text='row %s' % i)
+        
+        self.assertEqual(writer.flush(timeout=5), True)
+        self.assertEqual(self.base.count('test'), 26)
+        
+        # Only the bad rows are lost.
+        writer.add(text='good')
+        writer.add(id=1, text='duplicate')
+        writer.add(text='also good')
+        writer.flush()
+        self.assertEqual(self.base.count('test'), 28)
+        report = writer.report()
+        self.assertEqual((report['queued'], report['written'], report['failed'], report['pending']), (28, 27, 1, 0))
+        self.assertEqual(report['failures'][0][0], {'id': 1, 'text': 'duplicate'})
+        self.assert_(isinstance(report['failures'][0][1], psycopg2.IntegrityError))
+        
+        # As are rows with a column the table doesn't have, without holding
+        # up the rest of the batch.
+        writer.add(text='fine')
+        writer.add(txet='typo')
+        writer.add(text='also fine')
+        writer.flush()
+        self.assertEqual(self.base.count('test'), 30)
+        report = writer.report()
+        self.assertEqual((report['queued'], report['written'], report['failed'], report['retries']), (31, 29, 2, 0))
+        self.assertEqual(report['failures'][1][0], {'txet': 'typo'})
+        self.assert_(isinstance(report['failures'][1][1], QueryError))
+        
+        # Written once the delay is up, without a flush.
+        writer.add(text='later')
+        time.sleep(0.5)
+        self.assertEqual(self.base.count('test'), 31)
+        writer.close()
+        self.assertRaises(QueryError, writer.add, text='closed')
+        
+        # Closing the instance writes whatever's left.
+        bit = Bitty("postgres://postgres:@localhost:/bitty_test")
+        writer = bit.buffered('test', max_delay_ms=60000)
+        writer.add(text='last')
+        bit.close()
+        self.assertEqual(self.base.count('test'), 32)
+        
+        # Backpressure, with the writer stopped.
+        writer = self.base.buffered('test', max_queued=1, timeout=0.01)
+        writer.queue.put(None)
+        writer._thread.join()
+        writer.add(text='waiting')
+        self.assertRaises(BufferFull, writer.add, text='full')
+    
+    def test_buffered_retries(self):
+        writer = self.base.buffered('test', max_delay_ms=60000, retries=2, retry_delay_ms=1)
+        insert = writer._insert
+        errors = []
+        
+        def locked(rows):
+            if errors:
+                raise errors.pop()
+            
+            return insert(rows)
+        
+        writer._insert = locked
+        
+        # A lock keeps the whole batch & tries it again.
+        errors.extend([psycopg2.OperationalError('could not obtain lock'), psycopg2.OperationalError('could not obtain lock')])
+        writer.add(text='one')
+        writer.add(text='two')
+        writer.flush()
+        self.assertEqual(self.base.count('test'), 3)
+        report = writer.report()
+        self.assertEqual((report['written'], report['failed'], report['retries']), (2, 0, 2))
+        
+        # Past the retries, the rows are tried one at a time.
+        errors.extend([psycopg2.OperationalError('could not obtain lock'), psycopg2.OperationalError('could not obtain lock'), psycopg2.OperationalError('could not obtain lock')])
+        writer.add(text='three')
+        writer.add(text='four')
+        writer.flush()
+        self.assertEqual(self.base.count('test'), 5)
+        report = writer.report()
+        self.assertEqual((report['written'], report['failed'], report['retries']), (4, 0, 4))
+        
+        # Once a row has used up its retries as well, the database is still
+        # out of reach, so the rest aren't tried.
+        errors.extend([psycopg2.OperationalError('could not obtain lock')] * 6)
+        writer.add(text='five')
+        writer.add(text='six')
+        writer.flush()
+        self.assertEqual(self.base.count('test'), 5)
+        report = writer.report()
+        self.assertEqual((report['written'], report['failed'], report['retries']), (4, 2, 8))
+        self.assertEqual([row for row, error in report['failures']], [{'text': 'five'}, {'text': 'six'}])
+        self.assert_(isinstance(report['failures'][0][1], psycopg2.OperationalError))
+        
+        # Anything else is down to the query, so isn't retried.
+        errors.append(psycopg2.ProgrammingError('column "txet" of relation "test" does not exist'))
+        writer.add(text='seven')
+        writer.add(text='eight')
+        writer.flush()
+        self.assertEqual(self.base.count('test'), 7)
+        report = writer.report()
+        self.assertEqual((report['written'], report['failed'], report['retries']), (6, 2, 8))
+        writer.close()
+        
+        # Rows added while closing are either written or refused, never left
+        # behind in the queue.
+        writer = self.base.buffered('test', max_rows=10, max_delay_ms=10)
+        refused = []
+        
+        def add_rows():
+            for i in range(200):
+                try:
+                    writer.add(text='racing')
+                except QueryError:
+                    refused.append(i)
+        
+        threads = [threading.Thread(target=add_rows) for i in range(4)]
+        
+        for thread in threads:
+            thread.start()
+        
+        time.sleep(0.01)
+        writer.close()
+        
+        for thread in threads:
+            thread.join()
+        
+        report = writer.report()
+        self.assertEqual(report['pending'], 0)
+        self.assertEqual(report['queued'] + len(refused), 800)
+        self.assertEqual(report['written'], report['queued'])
+    
+    def test_commit_batching(self):
+        batched = Bitty("postgres://postgres:@localhost:/bitty_test", commit_every=5)
+        alternate = Bitty("postgres://postgres:@localhost:/bitty_test")
+        
+        # A failing statement only undoes itself, not the batch so far.
+        self.assertEqual(batched.add('people', name='One'), True)
+        self.assertEqual(batched.add('people', name='Two'), True)
+        self.assertRaises(psycopg2.IntegrityError, batched.add, 'people', id=1, name='Duplicate')
+        self.assertEqual(batched.add('people', name='Three'), True)
+        batched.commit()
+        self.assertEqual(alternate.count('people', name__in=['One', 'Two', 'Three']), 3)
+        batched.close()
+        alternate.close()
+    
     def test_update(self):
         self.assertEqual(self.base.update('people', 1, name='Daniel'), True)
         self.assertEqual(self.base.update('people', 1, age=27), True)
@@ -197,6 +2088,44 @@ class PostgresTestCase(unittest.TestCase):
         # Wrong kind of pk.
         self.assertEqual(self.base.delete('test', '100'), False)
     
+    def test_update_where(self):
+        self.assertEqual(self.base.update_where('people', {'age': 30}, age__gte=20), 2)
+        self.assertEqual([row['age'] for row in self.base.find('people', order_by='id')], [30, 7, 30])
+        self.assertEqual(self.base.update_where('people', {'name': 'Nobody'}, name__startswith='Nope'), 0)
+        self.assertEqual(self.base.update_where('people', {'name': 'Both', 'age': 1}, id__in=[1, 2]), 2)
+        self.assertEqual(self.base.find('people', name='Both', order_by='id'), [{'age': 1, 'id': 1, 'name': u'Both'}, {'age': 1, 'id': 2, 'name': u'Both'}])
+        self.assertRaises(QueryError, self.base.update_where, 'people', {'age': 1})
+        self.assertRaises(QueryError, self.base.update_where, 'people', {}, id=1)
+    
+    def test_delete_where(self):
+        self.assertEqual(self.base.delete_where('people', age__lt=30), 2)
+        self.assertEqual(self.base.find('people'), [{'age': 35, 'id': 3, 'name': u'Moof'}])
+        self.assertEqual(self.base.delete_where('people', name='Nope'), 0)
+        self.assertRaises(QueryError, self.base.delete_where, 'people')
+        self.assertEqual(self.base.delete_many('people', []), 0)
+        self.assertEqual(self.base.delete_many('people', [3, 10]), 1)
+        self.assertEqual(self.base.find('people'), [])
+    
+    def test_upsert(self):
+        self.assertEqual(self.base.upsert('people', 'id', id=1, name='Daniel', age=28), True)
+        self.assertEqual(self.base.upsert('people', ['id'], id=4, name='Bar', age=1), True)
+        self.assertEqual(self.base.find('people', id__in=[1, 4], order_by='id'), [{'age': 28, 'id': 1, 'name': u'Daniel'}, {'age': 1, 'id': 4, 'name': u'Bar'}])
+        # Only the key leaves an existing row alone.
+        self.assertEqual(self.base.upsert('people', 'id', id=2), True)
+        self.assertEqual(self.base.find('people', id=2), [{'age': 7, 'id': 2, 'name': u'Foo'}])
+        self.assertRaises(QueryError, self.base.upsert, 'people', 'id')
+        self.assertRaises(QueryError, self.base.upsert, 'people', [], name='Daniel')
+        self.assertRaises(QueryError, self.base.upsert, 'people', 'id', name='Daniel')
+    
+    def test_upsert_many(self):
+        self.assertEqual(self.base.upsert_many('people', 'id', []), 0)
+        self.assertEqual(self.base.upsert_many('people', 'id', [{'id': 2, 'age': 8}, {'id': 5, 'name': 'Baz', 'age': 2}, {'id': 3, 'age': 36}, {'id': 2, 'age': 9}], batch_size=2), 4)
+        self.assertEqual(self.base.find('people', order_by='id'), [{'age': 27, 'id': 1, 'name': u'Daniel'}, {'age': 9, 'id': 2, 'name': u'Foo'}, {'age': 36, 'id': 3, 'name': u'Moof'}, {'age': 2, 'id': 5, 'name': u'Baz'}])
+        self.assertRaises(QueryError, self.base.upsert_many, 'people', 'id', [{'name': 'Nope'}])
+        # Counted as given, though only the last row per key is written.
+        self.assertEqual(self.base.upsert_many('people', 'id', [{'id': 1, 'age': 28}, {'id': 1, 'age': 29}]), 2)
+        self.assertEqual(self.base.get('people', id=1)['age'], 29)
+    
     def test_find(self):
         self.assertEqual(self.base.find('people'), [{'age': 27, 'id': 1, 'name': u'Daniel'}, {'age': 7, 'id': 2, 'name': u'Foo'}, {'age': 35, 'id': 3, 'name': u'Moof'}])
         self.assertEqual(self.base.find('people', id=1), [{'age': 27, 'id': 1, 'name': u'Daniel'}])
@@ -209,6 +2138,110 @@ class PostgresTestCase(unittest.TestCase):
         self.assertEqual(self.base.find('people', id__gte=1, name__startswith='Dan'), [{'age': 27, 'id': 1, 'name': u'Daniel'}])
         self.assertEqual(self.base.find('people', name__contains='a'), [{'age': 27, 'id': 1, 'name': u'Daniel'}])
     
+    def test_find_ordering(self):
+        self.assertEqual([row['id'] for row in self.base.find('people', order_by='age')], [2, 1, 3])
+        self.assertEqual([row['id'] for row in self.base.find('people', order_by='-age')], [3, 1, 2])
+        self.assertEqual([row['id'] for row in self.base.find('people', order_by='id', limit=2)], [1, 2])
+        self.assertEqual([row['id'] for row in self.base.find('people', order_by='id', limit=2, offset=2)], [3])
+        self.assertEqual([row['id'] for row in self.base.find('people', order_by='id', offset=1)], [2, 3])
+        self.assertEqual([row['id'] for row in self.base.find('people', order_by='-age', after=27)], [2])
+        self.assertEqual([row['id'] for row in self.base.find('people', id__lt=3, order_by=['age', 'id'], after=(7, 2))], [1])
+        self.assertRaises(QueryError, self.base.find, 'people', order_by='nope')
+    
+    def test_find_chunked_in(self):
+        bit = Bitty("postgres://postgres:@localhost:/bitty_test", in_chunk_size=2)
+        bit.add_many('people', [{'name': 'Person %s' % i, 'age': i} for i in range(4, 10)])
+        ids = [9, 1, 2, 3, 4, 5, 2, 100]
+        self.assertEqual(sorted([row['id'] for row in bit.find('people', id__in=ids)]), [1, 2, 3, 4, 5, 9])
+        self.assertEqual([row['id'] for row in bit.find('people', id__in=ids, order_by='-age')], [3, 1, 9, 2, 5, 4])
+        self.assertEqual(bit.find('people', id__in=ids, order_by=['age'], fields=['name'], limit=2, offset=1), [{'name': u'Person 5'}, {'name': u'Foo'}])
+        self.assertEqual(bit.find('people', id__in=ids, age__lt=5, row_factory='tuple'), [(4, 4, u'Person 4')])
+        self.assertEqual(sorted([row['id'] for row in bit.iter_find('people', id__in=ids, chunk_size=1)]), [1, 2, 3, 4, 5, 9])
+        self.assertEqual([row['id'] for row in bit.iter_find('people', id__in=ids, order_by='id', limit=3)], [1, 2, 3])
+        self.assertEqual(bit.count('people', id__in=ids), 6)
+        self.assertEqual(bit.exists('people', id__in=[100, 101, 102, 9]), True)
+        
+        class Recorder(QueryHook):
+            def __init__(self):
+                self.queries = []
+            
+            def before_execute(self, query, params):
+                self.queries.append(query)
+        
+        # Stops at the first chunk with a match.
+        recorder = Recorder()
+        bit.add_hook(recorder)
+        self.assertEqual(bit.exists('people', id__in=[9, 1, 100, 101, 102, 103]), True)
+        bit.remove_hook(recorder)
+        self.assertEqual(len(recorder.queries), 1)
+        self.assertEqual(bit.update_where('people', {'age': 0}, id__in=ids), 6)
+        self.assertEqual(bit.delete_many('people', ids), 6)
+        self.assertEqual(bit.count('people'), 3)
+        bit.close()
+    
+    def test_find_fields(self):
+        self.assertEqual(self.base.find('people', fields=['id', 'name'], age__gte=20, order_by='id'), [{'id': 1, 'name': u'Daniel'}, {'id': 3, 'name': u'Moof'}])
+        self.assertEqual(self.base.find('people', fields=['name'], id=2, row_factory='tuple'), [(u'Foo',)])
+        self.assertEqual(self.base.get('people', fields=['age'], name='Moof'), {'age': 35})
+        self.assertEqual(list(self.base.iter_find('people', fields=['name', 'id'], chunk_size=2)), [{'id': 1, 'name': u'Daniel'}, {'id': 2, 'name': u'Foo'}, {'id': 3, 'name': u'Moof'}])
+        row = self.base.get('people', fields=['name'], id=1, row_factory='namedtuple')
+        self.assertEqual(row.name, u'Daniel')
+        self.assertRaises(AttributeError, getattr, row, 'age')
+        self.assertRaises(QueryError, self.base.find, 'people', fields=['text'])
+    
+    def test_search(self):
+        self.base.create_search_index('people', 'name')
+        self.base.add_many('people', [{'name': 'Toast Driven'}, {'name': 'Driven Daniel Driven'}])
+        self.assertEqual([row['id'] for row in self.base.find('people', name__search='driven', order_by='id')], [4, 5])
+        self.assertEqual([row['id'] for row in self.base.find('people', name__search='daniel driven')], [5])
+        self.assertEqual([row['id'] for row in self.base.find('people', name__search='Daniel', order_by='id')], [1, 5])
+        # Most relevant first.
+        self.assertEqual([row['id'] for row in self.base.find('people', name__search='driven', order_by='name__search')], [5, 4])
+        self.assertEqual(self.base.count('people', name__search='driven'), 2)
+        # No words to look for, so nothing matches.
+        self.assertEqual(self.base.find('people', name__search=''), [])
+        self.assertEqual(self.base.find('people', name__search='   ', order_by='name__search'), [])
+        self.assertEqual(self.base.count('people', name__search='!!'), 0)
+        self.base.update('people', 4, name='Burnt')
+        self.base.delete('people', 5)
+        self.assertEqual(self.base.find('people', name__search='driven'), [])
+        self.assertEqual(self.base.find('people', name__search='burnt'), [{'age': None, 'id': 4, 'name': u'Burnt'}])
+        self.assertRaises(QueryError, self.base.find, 'people', order_by='name__search')
+    
+    def test_iter_find(self):
+        results = self.base.iter_find('people')
+        self.assertEqual(next(results), {'age': 27, 'id': 1, 'name': u'Daniel'})
+        self.assertEqual(list(results), [{'age': 7, 'id': 2, 'name': u'Foo'}, {'age': 35, 'id': 3, 'name': u'Moof'}])
+        self.assertEqual(list(self.base.iter_find('people', chunk_size=2)), self.base.find('people'))
+        self.assertEqual(list(self.base.iter_find('people', chunk_size=1, id__gte=2)), [{'age': 7, 'id': 2, 'name': u'Foo'}, {'age': 35, 'id': 3, 'name': u'Moof'}])
+        self.assertEqual(list(self.base.iter_find('test', text='Daniel')), [])
+        
+        # A commit would close the server-side cursor, so writes wait until
+        # it's done. Reads are fine.
+        results = self.base.iter_find('people', chunk_size=1)
+        self.assertEqual(next(results)['id'], 1)
+        self.assertRaises(QueryError, self.base.add, 'people', name='Blocked')
+        self.assertRaises(QueryError, self.base.commit)
+        self.assertEqual(self.base.count('people'), 3)
+        self.assertEqual([row['id'] for row in results], [2, 3])
+        self.assertEqual(self.base.add('people', name='Unblocked'), True)
+    
+    def test_count(self):
+        self.assertEqual(self.base.count('people'), 3)
+        self.assertEqual(self.base.count('people', age__gte=20), 2)
+        self.assertEqual(self.base.count('people', name='Nope'), 0)
+        self.assertEqual(self.base.exists('people', name='Foo'), True)
+        self.assertEqual(self.base.exists('people', name__in=['Nope', 'Nada']), False)
+    
+    def test_aggregate(self):
+        self.assertEqual(self.base.aggregate('people', sum='age', min='age', max=['age', 'name']), {'age__max': 35, 'age__min': 7, 'age__sum': 69, 'name__max': u'Moof'})
+        self.assertEqual(self.base.aggregate('people', avg='age'), {'age__avg': 23})
+        self.assertEqual(self.base.aggregate('people', max='age', name='Nope'), {'age__max': None})
+        self.base.add('people', name='Foo', age=9)
+        self.assertEqual(self.base.aggregate('people', sum='age', max='id', group_by='name', age__lt=30), [{'age__sum': 27, 'id__max': 1, 'name': u'Daniel'}, {'age__sum': 16, 'id__max': 4, 'name': u'Foo'}])
+        self.assertRaises(QueryError, self.base.aggregate, 'people', group_by='name')
+        self.assertRaises(QueryError, self.base.aggregate, 'people', sum='nope')
+    
     def test_get(self):
         self.assertEqual(self.base.get('people', name='Daniel'), {'age': 27, 'id': 1, 'name': u'Daniel'})
         self.assertEqual(self.base.get('people', id=1, name='Daniel'), {'age': 27, 'id': 1, 'name': u'Daniel'})
@@ -262,6 +2295,160 @@ class MySQLTestCase(unittest.TestCase):
         self.assertEqual(self.base.add('people', name='Daniel'), True)
         self.assertEqual(self.base.add('test', text='foo'), True)
     
+    def test_add_many(self):
+        self.assertEqual(self.base.add_many('people', []), 0)
+        self.assertEqual(self.base.add_many('people', [{'name': 'Bar', 'age': 1}, {'name': 'Baz'}, {'name': 'Qux', 'age': 3}], batch_size=2), 3)
+        self.assertEqual(self.base.find('people', id__gt=3), [{'age': 1, 'id': 4, 'name': u'Bar'}, {'age': 3, 'id': 5, 'name': u'Qux'}, {'age': None, 'id': 6, 'name': u'Baz'}])
+        self.assertRaises(QueryError, self.base.add_many, 'test', [{'text': 'foo'}], copy=True)
+    
+    def test_buffered(self):
+        writer = self.base.buffered('test', max_rows=10, max_delay_ms=50)
+        
+        for i in range(25):
+            writer.add(text='row %s' % i)
+        
+        self.assertEqual(writer.flush(timeout=5), True)
+        self.assertEqual(self.base.count('test'), 26)
+        
+        # Only the bad rows are lost.
+        writer.add(text='good')
+        writer.add(id=1, text='duplicate')
+        writer.add(text='also good')
+        writer.flush()
+        self.assertEqual(self.base.count('test'), 28)
+        report = writer.report()
+        self.assertEqual((report['queued'], report['written'], report['failed'], report['pending']), (28, 27, 1, 0))
+        self.assertEqual(report['failures'][0][0], {'id': 1, 'text': 'duplicate'})
+        self.assert_(isinstance(report['failures'][0][1], MySQLdb.IntegrityError))
+        
+        # As are rows with a column the table doesn't have, without holding
+        # up the rest of the batch.
+        writer.add(text='fine')
+        writer.add(txet='typo')
+        writer.add(text='also fine')
+        writer.flush()
+        self.assertEqual(self.base.count('test'), 30)
+        report = writer.report()
+        self.assertEqual((report['queued'], report['written'], report['failed'], report['retries']), (31, 29, 2, 0))
+        self.assertEqual(report['failures'][1][0], {'txet': 'typo'})
+        self.assert_(isinstance(report['failures'][1][1], QueryError))
+        
+        # Written once the delay is up, without a flush.
+        writer.add(text='later')
+        time.sleep(0.5)
+        self.assertEqual(self.base.count('test'), 31)
+        writer.close()
+        self.assertRaises(QueryError, writer.add, text='closed')
+        
+        # Closing the instance writes whatever's left.
+        bit = Bitty("mysql://root:@localhost:/bitty_test")
+        writer = bit.buffered('test', max_delay_ms=60000)
+        writer.add(text='last')
+        bit.close()
+        self.assertEqual(self.base.count('test'), 32)
+        
+        # Backpressure, with the writer stopped.
+        writer = self.base.buffered('test', max_queued=1, timeout=0.01)
+        writer.queue.put(None)
+        writer._thread.join()
+        writer.add(text='waiting')
+        self.assertRaises(BufferFull, writer.add, text='full')
+    
+    def test_buffered_retries(self):
+        writer = self.base.buffered('test', max_delay_ms=60000, retries=2, retry_delay_ms=1)
+        insert = writer._insert
+        errors = []
+        
+        def locked(rows):
+            if errors:
+                raise errors.pop()
+            
+            return insert(rows)
+        
+        writer._insert = locked
+        
+        # A lock keeps the whole batch & tries it again.
+        errors.extend([MySQLdb.OperationalError(1205, 'Lock wait timeout exceeded'), MySQLdb.OperationalError(1205, 'Lock wait timeout exceeded')])
+        writer.add(text='one')
+        writer.add(text='two')
+        writer.flush()
+        self.assertEqual(self.base.count('test'), 3)
+        report = writer.report()
+        self.assertEqual((report['written'], report['failed'], report['retries']), (2, 0, 2))
+        
+        # Past the retries, the rows are tried one at a time.
+        errors.extend([MySQLdb.OperationalError(1205, 'Lock wait timeout exceeded'), MySQLdb.OperationalError(1205, 'Lock wait timeout exceeded'), MySQLdb.OperationalError(1205, 'Lock wait timeout exceeded')])
+        writer.add(text='three')
+        writer.add(text='four')
+        writer.flush()
+        self.assertEqual(self.base.count('test'), 5)
+        report = writer.report()
+        self.assertEqual((report['written'], report['failed'], report['retries']), (4, 0, 4))
+        
+        # Once a row has used up its retries as well, the database is still
+        # out of reach, so the rest aren't tried.
+        errors.extend([MySQLdb.OperationalError(1205, 'Lock wait timeout exceeded')] * 6)
+        writer.add(text='five')
+        writer.add(text='six')
+        writer.flush()
+        self.assertEqual(self.base.count('test'), 5)
+        report = writer.report()
+        self.assertEqual((report['written'], report['failed'], report['retries']), (4, 2, 8))
+        self.assertEqual([row for row, error in report['failures']], [{'text': 'five'}, {'text': 'six'}])
+        self.assert_(isinstance(report['failures'][0][1], MySQLdb.OperationalError))
+        
+        # Anything else is down to the query, so isn't retried.
+        errors.append(MySQLdb.OperationalError(1054, "Unknown column 'txet' in 'field list'"))
+        writer.add(text='seven')
+        writer.add(text='eight')
+        writer.flush()
+        self.assertEqual(self.base.count('test'), 7)
+        report = writer.report()
+        self.assertEqual((report['written'], report['failed'], report['retries']), (6, 2, 8))
+        writer.close()
+        
+        # Rows added while closing are either written or refused, never left
+        # behind in the queue.
+        writer = self.base.buffered('test', max_rows=10, max_delay_ms=10)
+        refused = []
+        
+        def add_rows():
+            for i in range(200):
+                try:
+                    writer.add(text='racing')
+                except QueryError:
+                    refused.append(i)
+        
+        threads = [threading.Thread(target=add_rows) for i in range(4)]
+        
+        for thread in threads:
+            thread.start()
+        
+        time.sleep(0.01)
+        writer.close()
+        
+        for thread in threads:
+            thread.join()
+        
+        report = writer.report()
+        self.assertEqual(report['pending'], 0)
+        self.assertEqual(report['queued'] + len(refused), 800)
+        self.assertEqual(report['written'], report['queued'])
+    
+    def test_commit_batching(self):
+        batched = Bitty("mysql://root:@localhost:/bitty_test", commit_every=5)
+        alternate = Bitty("mysql://root:@localhost:/bitty_test")
+        
+        # A failing statement only undoes itself, not the batch so far.
+        self.assertEqual(batched.add('people', name='One'), True)
+        self.assertEqual(batched.add('people', name='Two'), True)
+        self.assertRaises(MySQLdb.IntegrityError, batched.add, 'people', id=1, name='Duplicate')
+        self.assertEqual(batched.add('people', name='Three'), True)
+        batched.commit()
+        self.assertEqual(alternate.count('people', name__in=['One', 'Two', 'Three']), 3)
+        batched.close()
+        alternate.close()
+    
     def test_update(self):
         self.assertEqual(self.base.update('people', 1, name='Danielr'), True)
         self.assertEqual(self.base.update('people', 1, age=26), True)
@@ -276,6 +2463,44 @@ class MySQLTestCase(unittest.TestCase):
         # Wrong kind of pk.
         self.assertEqual(self.base.delete('test', '100'), False)
     
+    def test_update_where(self):
+        self.assertEqual(self.base.update_where('people', {'age': 30}, age__gte=20), 2)
+        self.assertEqual([row['age'] for row in self.base.find('people', order_by='id')], [30, 7, 30])
+        self.assertEqual(self.base.update_where('people', {'name': 'Nobody'}, name__startswith='Nope'), 0)
+        self.assertEqual(self.base.update_where('people', {'name': 'Both', 'age': 1}, id__in=[1, 2]), 2)
+        self.assertEqual(self.base.find('people', name='Both', order_by='id'), [{'age': 1, 'id': 1, 'name': u'Both'}, {'age': 1, 'id': 2, 'name': u'Both'}])
+        self.assertRaises(QueryError, self.base.update_where, 'people', {'age': 1})
+        self.assertRaises(QueryError, self.base.update_where, 'people', {}, id=1)
+    
+    def test_delete_where(self):
+        self.assertEqual(self.base.delete_where('people', age__lt=30), 2)
+        self.assertEqual(self.base.find('people'), [{'age': 35, 'id': 3, 'name': u'Moof'}])
+        self.assertEqual(self.base.delete_where('people', name='Nope'), 0)
+        self.assertRaises(QueryError, self.base.delete_where, 'people')
+        self.assertEqual(self.base.delete_many('people', []), 0)
+        self.assertEqual(self.base.delete_many('people', [3, 10]), 1)
+        self.assertEqual(self.base.find('people'), [])
+    
+    def test_upsert(self):
+        self.assertEqual(self.base.upsert('people', 'id', id=1, name='Daniel', age=28), True)
+        self.assertEqual(self.base.upsert('people', ['id'], id=4, name='Bar', age=1), True)
+        self.assertEqual(self.base.find('people', id__in=[1, 4], order_by='id'), [{'age': 28, 'id': 1, 'name': u'Daniel'}, {'age': 1, 'id': 4, 'name': u'Bar'}])
+        # Only the key leaves an existing row alone.
+        self.assertEqual(self.base.upsert('people', 'id', id=2), True)
+        self.assertEqual(self.base.find('people', id=2), [{'age': 7, 'id': 2, 'name': u'Foo'}])
+        self.assertRaises(QueryError, self.base.upsert, 'people', 'id')
+        self.assertRaises(QueryError, self.base.upsert, 'people', [], name='Daniel')
+        self.assertRaises(QueryError, self.base.upsert, 'people', 'id', name='Daniel')
+    
+    def test_upsert_many(self):
+        self.assertEqual(self.base.upsert_many('people', 'id', []), 0)
+        self.assertEqual(self.base.upsert_many('people', 'id', [{'id': 2, 'age': 8}, {'id': 5, 'name': 'Baz', 'age': 2}, {'id': 3, 'age': 36}, {'id': 2, 'age': 9}], batch_size=2), 4)
+        self.assertEqual(self.base.find('people', order_by='id'), [{'age': 27, 'id': 1, 'name': u'Daniel'}, {'age': 9, 'id': 2, 'name': u'Foo'}, {'age': 36, 'id': 3, 'name': u'Moof'}, {'age': 2, 'id': 5, 'name': u'Baz'}])
+        self.assertRaises(QueryError, self.base.upsert_many, 'people', 'id', [{'name': 'Nope'}])
+        # Counted as given, though only the last row per key is written.
+        self.assertEqual(self.base.upsert_many('people', 'id', [{'id': 1, 'age': 28}, {'id': 1, 'age': 29}]), 2)
+        self.assertEqual(self.base.get('people', id=1)['age'], 29)
+    
     def test_find(self):
         self.assertEqual(self.base.find('people'), [{'age': 27, 'id': 1, 'name': u'Daniel'}, {'age': 7, 'id': 2, 'name': u'Foo'}, {'age': 35, 'id': 3, 'name': u'Moof'}])
         self.assertEqual(self.base.find('people', id=1), [{'age': 27, 'id': 1, 'name': u'Daniel'}])
@@ -288,6 +2513,122 @@ class MySQLTestCase(unittest.TestCase):
         self.assertEqual(self.base.find('people', id__gte=1, name__startswith='Dan'), [{'age': 27, 'id': 1, 'name': u'Daniel'}])
         self.assertEqual(self.base.find('people', name__contains='a'), [{'age': 27, 'id': 1, 'name': u'Daniel'}])
     
+    def test_find_ordering(self):
+        self.assertEqual([row['id'] for row in self.base.find('people', order_by='age')], [2, 1, 3])
+        self.assertEqual([row['id'] for row in self.base.find('people', order_by='-age')], [3, 1, 2])
+        self.assertEqual([row['id'] for row in self.base.find('people', order_by='id', limit=2)], [1, 2])
+        self.assertEqual([row['id'] for row in self.base.find('people', order_by='id', limit=2, offset=2)], [3])
+        self.assertEqual([row['id'] for row in self.base.find('people', order_by='id', offset=1)], [2, 3])
+        self.assertEqual([row['id'] for row in self.base.find('people', order_by='-age', after=27)], [2])
+        self.assertEqual([row['id'] for row in self.base.find('people', id__lt=3, order_by=['age', 'id'], after=(7, 2))], [1])
+        self.assertRaises(QueryError, self.base.find, 'people', order_by='nope')
+    
+    def test_find_chunked_in(self):
+        bit = Bitty("mysql://root:@localhost:/bitty_test", in_chunk_size=2)
+        bit.add_many('people', [{'name': 'Person %s' % i, 'age': i} for i in range(4, 10)])
+        ids = [9, 1, 2, 3, 4, 5, 2, 100]
+        self.assertEqual(sorted([row['id'] for row in bit.find('people', id__in=ids)]), [1, 2, 3, 4, 5, 9])
+        self.assertEqual([row['id'] for row in bit.find('people', id__in=ids, order_by='-age')], [3, 1, 9, 2, 5, 4])
+        self.assertEqual(bit.find('people', id__in=ids, order_by=['age'], fields=['name'], limit=2, offset=1), [{'name': u'Person 5'}, {'name': u'Foo'}])
+        self.assertEqual(bit.find('people', id__in=ids, age__lt=5, row_factory='tuple'), [(4, 4, u'Person 4')])
+        self.assertEqual(sorted([row['id'] for row in bit.iter_find('people', id__in=ids, chunk_size=1)]), [1, 2, 3, 4, 5, 9])
+        self.assertEqual([row['id'] for row in bit.iter_find('people', id__in=ids, order_by='id', limit=3)], [1, 2, 3])
+        self.assertEqual(bit.count('people', id__in=ids), 6)
+        self.assertEqual(bit.exists('people', id__in=[100, 101, 102, 9]), True)
+        
+        class Recorder(QueryHook):
+            def __init__(self):
+                self.queries = []
+            
+            def before_execute(self, query, params):
+                self.queries.append(query)
+        
+        # Stops at the first chunk with a match.
+        recorder = Recorder()
+        bit.add_hook(recorder)
+        self.assertEqual(bit.exists('people', id__in=[9, 1, 100, 101, 102, 103]), True)
+        bit.remove_hook(recorder)
+        self.assertEqual(len(recorder.queries), 1)
+        self.assertEqual(bit.update_where('people', {'age': 0}, id__in=ids), 6)
+        self.assertEqual(bit.delete_many('people', ids), 6)
+        self.assertEqual(bit.count('people'), 3)
+        bit.close()
+        
+        # The placeholders add up across every '__in' list, not just the
+        # longest one.
+        bit = Bitty("mysql://root:@localhost:/bitty_test")
+        ids = list(range(1, 601))
+        names = [u'Person 6', u'Person 8'] + ['Nobody %s' % i for i in range(598)]
+        lookups = bit.adapter._split_in_lookup({'id__in': ids, 'name__in': names})
+        self.assertEqual(max([len(chunk['id__in']) + len(chunk['name__in']) for chunk in lookups]), 1000)
+        self.assertEqual(sorted([row['id'] for row in bit.find('people', id__in=ids, name__in=names)]), [6, 8])
+        self.assertEqual(bit.count('people', id__in=ids, name__in=names), 2)
+        self.assertRaises(QueryError, bit.aggregate, 'people', sum='age', id__in=ids, name__in=names)
+        self.assertEqual(bit.aggregate('people', sum='age', id__in=ids[:10], name__in=names[:10]), {'age__sum': 14})
+        bit.close()
+    
+    def test_find_fields(self):
+        self.assertEqual(self.base.find('people', fields=['id', 'name'], age__gte=20, order_by='id'), [{'id': 1, 'name': u'Daniel'}, {'id': 3, 'name': u'Moof'}])
+        self.assertEqual(self.base.find('people', fields=['name'], id=2, row_factory='tuple'), [(u'Foo',)])
+        self.assertEqual(self.base.get('people', fields=['age'], name='Moof'), {'age': 35})
+        self.assertEqual(list(self.base.iter_find('people', fields=['name', 'id'], chunk_size=2)), [{'id': 1, 'name': u'Daniel'}, {'id': 2, 'name': u'Foo'}, {'id': 3, 'name': u'Moof'}])
+        row = self.base.get('people', fields=['name'], id=1, row_factory='namedtuple')
+        self.assertEqual(row.name, u'Daniel')
+        self.assertRaises(AttributeError, getattr, row, 'age')
+        self.assertRaises(QueryError, self.base.find, 'people', fields=['text'])
+    
+    def test_search(self):
+        self.base.create_search_index('people', 'name')
+        self.base.add_many('people', [{'name': 'Toast Driven'}, {'name': 'Driven Daniel Driven'}])
+        self.assertEqual([row['id'] for row in self.base.find('people', name__search='driven', order_by='id')], [4, 5])
+        self.assertEqual([row['id'] for row in self.base.find('people', name__search='daniel driven')], [5])
+        self.assertEqual([row['id'] for row in self.base.find('people', name__search='Daniel', order_by='id')], [1, 5])
+        # Most relevant first.
+        self.assertEqual([row['id'] for row in self.base.find('people', name__search='driven', order_by='name__search')], [5, 4])
+        self.assertEqual(self.base.count('people', name__search='driven'), 2)
+        # No words to look for, so nothing matches.
+        self.assertEqual(self.base.find('people', name__search=''), [])
+        self.assertEqual(self.base.find('people', name__search='   ', order_by='name__search'), [])
+        self.assertEqual(self.base.count('people', name__search='!!'), 0)
+        self.base.update('people', 4, name='Burnt')
+        self.base.delete('people', 5)
+        self.assertEqual(self.base.find('people', name__search='driven'), [])
+        self.assertEqual(self.base.find('people', name__search='burnt'), [{'age': None, 'id': 4, 'name': u'Burnt'}])
+        self.assertRaises(QueryError, self.base.find, 'people', order_by='name__search')
+    
+    def test_iter_find(self):
+        results = self.base.iter_find('people')
+        self.assertEqual(next(results), {'age': 27, 'id': 1, 'name': u'Daniel'})
+        self.assertEqual(list(results), [{'age': 7, 'id': 2, 'name': u'Foo'}, {'age': 35, 'id': 3, 'name': u'Moof'}])
+        self.assertEqual(list(self.base.iter_find('people', chunk_size=2)), self.base.find('people'))
+        self.assertEqual(list(self.base.iter_find('people', chunk_size=1, id__gte=2)), [{'age': 7, 'id': 2, 'name': u'Foo'}, {'age': 35, 'id': 3, 'name': u'Moof'}])
+        self.assertEqual(list(self.base.iter_find('test', text='Daniel')), [])
+        
+        # Nothing else can use the connection until the unbuffered rows are
+        # read (or the generator's closed).
+        results = self.base.iter_find('people', chunk_size=1)
+        self.assertEqual(next(results)['id'], 1)
+        self.assertRaises(QueryError, self.base.add, 'people', name='Blocked')
+        self.assertRaises(QueryError, self.base.count, 'people')
+        results.close()
+        self.assertEqual(self.base.add('people', name='Unblocked'), True)
+    
+    def test_count(self):
+        self.assertEqual(self.base.count('people'), 3)
+        self.assertEqual(self.base.count('people', age__gte=20), 2)
+        self.assertEqual(self.base.count('people', name='Nope'), 0)
+        self.assertEqual(self.base.exists('people', name='Foo'), True)
+        self.assertEqual(self.base.exists('people', name__in=['Nope', 'Nada']), False)
+    
+    def test_aggregate(self):
+        self.assertEqual(self.base.aggregate('people', sum='age', min='age', max=['age', 'name']), {'age__max': 35, 'age__min': 7, 'age__sum': 69, 'name__max': u'Moof'})
+        self.assertEqual(self.base.aggregate('people', avg='age'), {'age__avg': 23})
+        self.assertEqual(self.base.aggregate('people', max='age', name='Nope'), {'age__max': None})
+        self.base.add('people', name='Foo', age=9)
+        self.assertEqual(self.base.aggregate('people', sum='age', max='id', group_by='name', age__lt=30), [{'age__sum': 27, 'id__max': 1, 'name': u'Daniel'}, {'age__sum': 16, 'id__max': 4, 'name': u'Foo'}])
+        self.assertRaises(QueryError, self.base.aggregate, 'people', group_by='name')
+        self.assertRaises(QueryError, self.base.aggregate, 'people', sum='nope')
+    
     def test_get(self):
         self.assertEqual(self.base.get('people', name='Daniel'), {'age': 27, 'id': 1, 'name': u'Daniel'})
         self.assertEqual(self.base.get('people', id=1, name='Daniel'), {'age': 27, 'id': 1, 'name': u'Daniel'})